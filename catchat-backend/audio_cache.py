@@ -0,0 +1,195 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("catchat")
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def audio_key(text, voice, model, response_format="mp3"):
+    """Content address of a synthesized clip: the same text, voice and model always sound the same"""
+    payload = {"text": text, "voice": voice, "model": model, "format": response_format}
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def parse_byte_range(header, size):
+    """(start, end) inclusive for a single ``bytes=`` range, or None to send the whole file.
+
+    Multiple ranges are answered with the whole file, which RFC 9110 allows.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        elif last:
+            # bytes=-N is the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(f"Range {header!r} is outside the {size}-byte file")
+    return start, min(end, size - 1)
+
+
+class AudioCacheWriter:
+    """Collects one clip while it streams; only a complete clip becomes a cache entry"""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.size = 0
+        self._tmp_path = os.path.join(cache.directory, f".{key}.{uuid.uuid4().hex}.part")
+        try:
+            self._file = open(self._tmp_path, "wb")
+        except OSError as e:
+            logger.error("Could not cache synthesized audio %s: %s", key, e)
+            self._file = None
+
+    def write(self, chunk):
+        if self._file is None:
+            return
+        self.size += len(chunk)
+        if self.size > self.cache.max_entry_bytes:
+            self.abort()
+            return
+        try:
+            self._file.write(chunk)
+        except OSError as e:
+            logger.error("Could not cache synthesized audio %s: %s", self.key, e)
+            self.abort()
+
+    def commit(self):
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+            self._file = None
+            os.replace(self._tmp_path, self.cache.path(self.key))
+        except OSError as e:
+            logger.error("Could not cache synthesized audio %s: %s", self.key, e)
+            self.abort()
+            return
+        self.cache._added(self.key, self.size)
+
+    def abort(self):
+        """Drop the partial clip; the stream it came from carries on uncached"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+class AudioCache:
+    """Content-addressed directory of synthesized clips, trimmed least recently used first.
+
+    One file per ``audio_key``. A hit refreshes the file's mtime, so the
+    recency order survives restarts; once the directory grows past
+    ``max_bytes`` the least recently served clips are deleted.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, max_entry_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # A single clip may not take more than an eighth of the cache
+        self.max_entry_bytes = max_entry_bytes or max(max_bytes // 8, 1)
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # key -> size, least recently used first
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".part"):
+                # Left behind by a stream that was cut off when the process stopped
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if not name.endswith(".audio"):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-6], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._files[key] = size
+            self._bytes += size
+        logger.info("Audio cache has %d clips (%d bytes) in %s", len(self._files), self._bytes, self.directory)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".audio")
+
+    def get(self, key):
+        """(path, size) of the cached clip for ``key``, or None"""
+        with self._lock:
+            size = self._files.get(key)
+            if size is None:
+                self.misses += 1
+                return None
+            self._files.move_to_end(key)
+            self.hits += 1
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            # Evicted or removed by hand
+            with self._lock:
+                self._bytes -= self._files.pop(key, 0)
+            return None
+        return self.path(key), size
+
+    def writer(self, key):
+        return AudioCacheWriter(self, key)
+
+    def _added(self, key, size):
+        with self._lock:
+            self._bytes += size - self._files.pop(key, 0)
+            self._files[key] = size
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                oldest, oldest_size = self._files.popitem(last=False)
+                self._bytes -= oldest_size
+                self.evictions += 1
+                try:
+                    os.remove(self.path(oldest))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._files),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
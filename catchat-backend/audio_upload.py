@@ -0,0 +1,144 @@
+"""Receiving audio uploads without holding them in memory.
+
+``receive_upload`` parses the multipart request body as it arrives and
+copies the file part, chunk by chunk, into a SpooledTemporaryFile: short
+clips stay in memory, longer ones roll over to disk. As soon as more than
+``max_bytes`` of file data has arrived the upload is refused with
+UploadTooLarge, without reading the rest of the body. A body that is
+not valid multipart data, or ends inside the file part, is refused with
+UploadError.
+"""
+import tempfile
+
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+# Room for the multipart headers and any small form fields next to the file
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadError(ValueError):
+    pass
+
+
+class UploadTooLarge(UploadError):
+    pass
+
+
+class SpooledUpload:
+    """The received file part; ``file`` is positioned at the start"""
+
+    def __init__(self, file, filename, content_type, size):
+        self.file = file
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+
+    def close(self):
+        self.file.close()
+
+
+class _FilePart:
+    """python-multipart callbacks that collect the data of one named file field"""
+
+    def __init__(self, field):
+        self.field = field
+        self.found = False
+        self.filename = None
+        self.content_type = None
+        self.capturing = False
+        self.chunks = []
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if name == self.field and b"filename" in options and not self.found:
+            self.found = True
+            self.capturing = True
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self.content_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+
+    def on_part_data(self, data, start, end):
+        if self.capturing:
+            # The parser reuses its buffer, so keep a copy
+            self.chunks.append(bytes(data[start:end]))
+
+    def on_part_end(self):
+        self.capturing = False
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+async def receive_upload(request, field="file", max_bytes=25 * 1024 * 1024, spool_bytes=1024 * 1024):
+    """Stream the ``field`` file of a multipart/form-data request into a spooled temporary file"""
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise UploadError("Expected a multipart/form-data upload")
+    body_limit = max_bytes + FORM_OVERHEAD_BYTES
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > body_limit:
+        raise UploadTooLarge(f"Upload is larger than {max_bytes} bytes")
+
+    part = _FilePart(field)
+    parser = MultipartParser(params[b"boundary"], part.callbacks())
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    received = size = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > body_limit:
+                raise UploadTooLarge(f"Upload is larger than {max_bytes} bytes")
+            try:
+                parser.write(chunk)
+            except MultipartParseError as e:
+                raise UploadError(f"Malformed multipart upload: {e}") from e
+            for data in part.drain():
+                size += len(data)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload is larger than {max_bytes} bytes")
+                if size > spool_bytes:
+                    # Past the in-memory threshold the spool rolls over, so every write is a disk write
+                    await run_in_threadpool(spool.write, data)
+                else:
+                    spool.write(data)
+        parser.finalize()
+        if not part.found:
+            raise UploadError(f"No '{field}' file in the upload")
+        if part.capturing:
+            raise UploadError("Upload ended in the middle of the file")
+        spool.seek(0)
+        return SpooledUpload(spool, part.filename, part.content_type, size)
+    except BaseException:
+        spool.close()
+        raise
@@ -0,0 +1,233 @@
+"""Compare query plans before and after the schema migrations.
+
+Builds a scratch database with the original (pre-migration) tables,
+fills it with generated data, runs representative queries, applies the
+migrations with migrate.py's Migrator and runs the same queries again.
+For each query it prints the EXPLAIN access type, index, partitions and
+estimated rows, plus the median wall time of several runs.
+
+    python benchmark_schema.py --rows 5000000 --database catchat_bench
+
+The scratch database is dropped and recreated; never point it at real data.
+The MySQL user needs CREATE/DROP on it.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from datetime import datetime, timedelta
+
+import mysql.connector
+from dotenv import load_dotenv
+
+from migrate import Migrator
+
+BASELINE_TABLES = [
+    """CREATE TABLE `users` (
+      `id` int NOT NULL AUTO_INCREMENT,
+      `username` varchar(255) NOT NULL,
+      `email` varchar(255) DEFAULT NULL,
+      `last_login` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+      `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+      PRIMARY KEY (`id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci""",
+    """CREATE TABLE `chat_history` (
+      `id` int NOT NULL AUTO_INCREMENT,
+      `user_id` int DEFAULT NULL,
+      `message` text,
+      `response` text,
+      `timestamp` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+      PRIMARY KEY (`id`),
+      KEY `user_id` (`user_id`),
+      CONSTRAINT `chat_history_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci""",
+    """CREATE TABLE `sessions` (
+      `id` int NOT NULL AUTO_INCREMENT,
+      `user_id` int DEFAULT NULL,
+      `session_start` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+      `session_end` timestamp NULL DEFAULT NULL,
+      PRIMARY KEY (`id`),
+      KEY `user_id` (`user_id`),
+      CONSTRAINT `sessions_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci""",
+    """CREATE TABLE `quantum_applications` (
+      `id` int NOT NULL AUTO_INCREMENT,
+      `name` varchar(100) NOT NULL,
+      PRIMARY KEY (`id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci""",
+    """CREATE TABLE `quantum_intent_mapping` (
+      `id` int NOT NULL AUTO_INCREMENT,
+      `intent_pattern` text NOT NULL,
+      `quantum_application_id` int NOT NULL,
+      `confidence_threshold` float NOT NULL DEFAULT 0.7,
+      `parameter_extraction_pattern` text,
+      `example_phrases` JSON,
+      `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+      PRIMARY KEY (`id`),
+      KEY `quantum_application_id` (`quantum_application_id`),
+      CONSTRAINT `quantum_intent_mapping_ibfk_1` FOREIGN KEY (`quantum_application_id`) REFERENCES `quantum_applications` (`id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci""",
+]
+
+
+def build_queries(users, start, months):
+    """Representative reads, with parameters that hit the generated data"""
+    user_id = users // 2
+    month_start = (start + timedelta(days=31 * (months // 2))).replace(day=1)
+    month_end = (month_start + timedelta(days=32)).replace(day=1)
+    window_end = start + timedelta(days=30 * months)
+    window_start = window_end - timedelta(days=7)
+    return [
+        ("latest history of a user",
+         "SELECT id, message, `timestamp` FROM chat_history WHERE user_id = %s "
+         "ORDER BY `timestamp` DESC, id DESC LIMIT 50", (user_id,)),
+        ("user history in the last week",
+         "SELECT id, message FROM chat_history WHERE user_id = %s AND `timestamp` >= %s AND `timestamp` < %s",
+         (user_id, window_start, window_end)),
+        ("messages in one month",
+         "SELECT COUNT(*) FROM chat_history WHERE `timestamp` >= %s AND `timestamp` < %s",
+         (month_start, month_end)),
+        ("recent sessions of a user",
+         "SELECT session_start, session_end FROM sessions WHERE user_id = %s "
+         "ORDER BY session_start DESC LIMIT 10", (user_id,)),
+        # The duplicate check of the intent seeding scripts, served by the intent_pattern(255) prefix index
+        ("intent pattern lookup",
+         "SELECT id FROM quantum_intent_mapping WHERE intent_pattern = %s", ("pattern 2500",)),
+    ]
+
+
+def run(cursor, statement, params=None):
+    cursor.execute(statement, params)
+    if cursor.with_rows:
+        return cursor.fetchall()
+    return None
+
+
+def create_dataset(conn, rows, users, months, start):
+    cursor = conn.cursor()
+    for statement in BASELINE_TABLES:
+        run(cursor, statement)
+
+    # A 0..9,999,999 sequence from cross-joined digits keeps generation in SQL
+    run(cursor, "CREATE TABLE digits (d int NOT NULL PRIMARY KEY)")
+    run(cursor, "INSERT INTO digits VALUES (0),(1),(2),(3),(4),(5),(6),(7),(8),(9)")
+    run(cursor, """
+        CREATE VIEW seq AS
+        SELECT a.d + 10*b.d + 100*c.d + 1000*e.d + 10000*f.d + 100000*g.d + 1000000*h.d AS n
+        FROM digits a, digits b, digits c, digits e, digits f, digits g, digits h
+    """)
+    seconds = int(months * 30 * 86400)
+
+    print(f"Generating {users} users, {rows} chats and {rows // 10} sessions over {months} months...")
+    run(cursor, "INSERT INTO users (id, username) SELECT n + 1, CONCAT('user', n) FROM seq WHERE n < %s", (users,))
+    conn.commit()
+    batch = 1_000_000
+    for offset in range(0, rows, batch):
+        run(cursor, """
+            INSERT INTO chat_history (user_id, message, response, `timestamp`)
+            SELECT 1 + MOD(n * 7919, %s),
+                   CONCAT('message ', n, ' about qubits'),
+                   CONCAT('Summary: reply ', n, '\\nDetails: generated'),
+                   TIMESTAMPADD(SECOND, (n * %s) DIV %s, %s)
+            FROM seq WHERE n >= %s AND n < %s
+        """, (users, seconds, rows, start, offset, min(offset + batch, rows)))
+        conn.commit()
+        print(f"  {min(offset + batch, rows)} chats")
+    run(cursor, """
+        INSERT INTO sessions (user_id, session_start, session_end)
+        SELECT 1 + MOD(n * 7919, %s),
+               TIMESTAMPADD(SECOND, (n * %s) DIV %s, %s),
+               TIMESTAMPADD(SECOND, (n * %s) DIV %s + 600, %s)
+        FROM seq WHERE n < %s
+    """, (users, seconds, rows // 10, start, seconds, rows // 10, start, rows // 10))
+    run(cursor, "INSERT INTO quantum_applications (id, name) SELECT n + 1, CONCAT('app', n) FROM seq WHERE n < 20")
+    run(cursor, """
+        INSERT INTO quantum_intent_mapping (intent_pattern, quantum_application_id, confidence_threshold)
+        SELECT CONCAT('pattern ', n), 1 + MOD(n, 20), 0.5 + MOD(n, 50) / 100 FROM seq WHERE n < 5000
+    """)
+    conn.commit()
+    for table in ("chat_history", "sessions", "quantum_intent_mapping"):
+        run(cursor, f"ANALYZE TABLE {table}")
+    cursor.close()
+
+
+def measure(conn, queries, repeats):
+    results = []
+    cursor = conn.cursor(dictionary=True)
+    for label, statement, params in queries:
+        plan = run(cursor, "EXPLAIN " + statement, params)[0]
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            run(cursor, statement, params)
+            timings.append(time.perf_counter() - started)
+        results.append({
+            "query": label,
+            "type": plan.get("type"),
+            "key": plan.get("key"),
+            "partitions": plan.get("partitions"),
+            "rows": plan.get("rows"),
+            "extra": plan.get("Extra"),
+            "ms": statistics.median(timings) * 1000,
+        })
+    cursor.close()
+    return results
+
+
+def print_comparison(before, after):
+    for old, new in zip(before, after):
+        print(f"\n{old['query']}")
+        for label, result in (("before", old), ("after", new)):
+            partitions = result["partitions"] or "-"
+            if len(partitions) > 40:
+                partitions = partitions[:37] + "..."
+            print(f"  {label:6}  type={result['type']}  key={result['key']}  rows~{result['rows']}  "
+                  f"partitions={partitions}  {result['ms']:.2f} ms")
+            if result["extra"]:
+                print(f"          {result['extra']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the chat_history schema migration")
+    parser.add_argument("--database", default="catchat_bench")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+    if args.rows > 10_000_000:
+        parser.error("--rows is limited to 10,000,000")
+
+    load_dotenv()
+    conn = mysql.connector.connect(
+        host=os.getenv("MYSQL_HOST"),
+        port=int(os.getenv("MYSQL_PORT", "3306")),
+        user=os.getenv("MYSQL_USER"),
+        password=os.getenv("MYSQL_PASSWORD")
+    )
+    cursor = conn.cursor()
+    run(cursor, f"DROP DATABASE IF EXISTS `{args.database}`")
+    run(cursor, f"CREATE DATABASE `{args.database}`")
+    run(cursor, f"USE `{args.database}`")
+    cursor.close()
+
+    now = datetime.now().replace(microsecond=0)
+    start = now - timedelta(days=30 * args.months)
+    create_dataset(conn, args.rows, args.users, args.months, start)
+    queries = build_queries(args.users, start, args.months)
+
+    before = measure(conn, queries, args.repeats)
+    print("\nApplying migrations...")
+    started = time.perf_counter()
+    Migrator(conn, echo=lambda line: print("  " + line[:120])).up()
+    print(f"Migrations took {time.perf_counter() - started:.1f}s")
+    after = measure(conn, queries, args.repeats)
+
+    print_comparison(before, after)
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""Building blocks of the OpenAI-compatible /v1/chat/completions gateway.
+
+Internal tools point an OpenAI SDK at Catchat and their requests go
+upstream through the shared LLMClient pool. This module holds what the
+endpoint needs besides that: caller identification by API key, a cap on
+each caller's in-flight requests, per-user usage accounting that is
+flushed to gateway_usage, and the OpenAI wire format for replies that
+never went upstream (cache hits).
+"""
+import json
+import time
+import uuid
+import hmac
+import logging
+import threading
+from datetime import date
+
+from mysql.connector import Error
+
+from metrics import REGISTRY, Counter
+
+logger = logging.getLogger("catchat")
+
+GATEWAY_TOKENS = REGISTRY.register(Counter(
+    "catchat_gateway_tokens_total", "Tokens sent and received through /v1/chat/completions", labels=("kind",)
+))
+
+# Longest user name kept, the width of gateway_usage.user_name
+MAX_USER_LENGTH = 64
+
+# Parameters whose effect cannot be relayed as the text of a single choice, each
+# with the test for a value that needs it. Other unknown parameters the SDKs send
+# routinely (stream_options, logit_bias, ...) are ignored.
+UNSUPPORTED_PARAMETERS = {
+    "tools": bool,
+    "functions": bool,
+    "tool_choice": lambda value: value not in (None, "none", "auto"),
+    "function_call": lambda value: value not in (None, "none", "auto"),
+    "n": lambda value: value not in (None, 1),
+    "response_format": lambda value: value not in (None, {"type": "text"}),
+    "logprobs": bool,
+    "top_logprobs": bool,
+}
+
+
+class CallerBusy(Exception):
+    """The caller already has as many requests in flight as it may"""
+
+
+def unsupported_parameters(parameters):
+    """Sorted names of the request parameters the gateway cannot honour"""
+    return sorted(
+        name for name, value in parameters.items()
+        if name in UNSUPPORTED_PARAMETERS and UNSUPPORTED_PARAMETERS[name](value)
+    )
+
+
+def parse_api_keys(spec):
+    """``key:name,key:name`` -> {key: name}; a key given without a name is named after its first characters"""
+    keys = {}
+    for item in (spec or "").split(","):
+        key, _, name = item.strip().partition(":")
+        if key:
+            keys[key] = name.strip() or f"key-{key[:6]}"
+    return keys
+
+
+def identify_caller(authorization, api_keys):
+    """Caller name for an ``Authorization: Bearer`` header, or None if it matches no key"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    supplied = token.strip().encode()
+    caller = None
+    for key, name in api_keys.items():
+        # Compare against every key so the time taken does not reveal which one matched
+        if hmac.compare_digest(supplied, key.encode()):
+            caller = name
+    return caller
+
+
+class CallerLimits:
+    """At most ``max_in_flight`` concurrent requests per caller; extra ones are refused, not queued"""
+
+    def __init__(self, max_in_flight=8):
+        self.max_in_flight = max_in_flight
+        self._in_flight = {}
+        self.rejected = 0
+
+    def acquire(self, caller):
+        count = self._in_flight.get(caller, 0)
+        if count >= self.max_in_flight:
+            self.rejected += 1
+            raise CallerBusy(f"{caller} already has {count} requests in flight")
+        self._in_flight[caller] = count + 1
+
+    def release(self, caller):
+        count = self._in_flight.get(caller, 0) - 1
+        if count > 0:
+            self._in_flight[caller] = count
+        else:
+            self._in_flight.pop(caller, None)
+
+    def in_flight(self, caller=None):
+        if caller is not None:
+            return self._in_flight.get(caller, 0)
+        return sum(self._in_flight.values())
+
+    def stats(self):
+        return {
+            "max_in_flight_per_caller": self.max_in_flight,
+            "callers": len(self._in_flight),
+            "in_flight": self.in_flight(),
+            "rejected": self.rejected,
+        }
+
+
+def estimate_tokens(text):
+    """Rough token count (four characters a token) for replies the upstream did not count"""
+    return (len(text) + 3) // 4 if text else 0
+
+
+def estimate_prompt_tokens(messages):
+    # Each message costs a few tokens of framing on top of its content
+    return sum(estimate_tokens(str(message.get("content") or "")) + 4 for message in messages)
+
+
+class UsageLedger:
+    """Per-user request, token and latency totals for the gateway.
+
+    ``record`` is called once per request from the event loop. Totals
+    since startup are kept in memory for /internal/gateway/usage; the
+    increments since the last flush are added to gateway_usage (one row
+    per day, user and model) every ``interval`` seconds by a background
+    thread, the same way MetricsRecorder writes its table.
+    """
+
+    FIELDS = ("requests", "cached_requests", "failed_requests", "estimated_requests",
+              "prompt_tokens", "completion_tokens", "latency_seconds")
+
+    def __init__(self, pool, interval=60):
+        self.pool = pool
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._totals = {}   # user -> field -> value, since startup
+        self._pending = {}  # (day, user, model) -> field -> value, since the last flush
+        self._stop = threading.Event()
+        self._thread = None
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def record(self, user, model, prompt_tokens=0, completion_tokens=0, seconds=0.0,
+               cached=False, ok=True, estimated=False):
+        user = (user or "unknown")[:MAX_USER_LENGTH]
+        model = (model or "unknown")[:MAX_USER_LENGTH]
+        increments = {
+            "requests": 1,
+            "cached_requests": int(cached),
+            "failed_requests": int(not ok),
+            "estimated_requests": int(estimated),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency_seconds": seconds,
+        }
+        with self._lock:
+            for counters in (
+                self._totals.setdefault(user, dict.fromkeys(self.FIELDS, 0)),
+                self._pending.setdefault((date.today(), user, model), dict.fromkeys(self.FIELDS, 0)),
+            ):
+                for field, amount in increments.items():
+                    counters[field] += amount
+        if prompt_tokens:
+            GATEWAY_TOKENS.inc("prompt", amount=prompt_tokens)
+        if completion_tokens:
+            GATEWAY_TOKENS.inc("completion", amount=completion_tokens)
+
+    def usage(self, user=None):
+        """Totals since startup by user, for one user or all of them"""
+        with self._lock:
+            return {
+                name: dict(counters) for name, counters in self._totals.items()
+                if user is None or name == user
+            }
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="gateway-usage", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        rows = [
+            (day, user, model) + tuple(counters[field] for field in self.FIELDS)
+            for (day, user, model), counters in pending.items()
+        ]
+        columns = ("day", "user_name", "model") + self.FIELDS
+        query = (
+            f"INSERT INTO gateway_usage ({', '.join(f'`{column}`' for column in columns)}) VALUES "
+            + ", ".join(["(" + ", ".join(["%s"] * len(columns)) + ")"] * len(rows))
+            + " ON DUPLICATE KEY UPDATE "
+            + ", ".join(f"`{field}` = `{field}` + VALUES(`{field}`)" for field in self.FIELDS)
+        )
+        params = [value for row in rows for value in row]
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(query, params)
+                    conn.commit()
+                finally:
+                    cursor.close()
+            self.flushes += 1
+        except Error as e:
+            self.failed_flushes += 1
+            logger.error("Could not write gateway usage (%d rows): %s", len(rows), e)
+            # Keep the counts for the next flush rather than losing them
+            with self._lock:
+                for key, counters in pending.items():
+                    merged = self._pending.setdefault(key, dict.fromkeys(self.FIELDS, 0))
+                    for field, amount in counters.items():
+                        merged[field] += amount
+
+    def stats(self):
+        with self._lock:
+            users = len(self._totals)
+            pending = len(self._pending)
+            requests = sum(counters["requests"] for counters in self._totals.values())
+        return {
+            "users": users,
+            "requests": requests,
+            "pending_rows": pending,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+        }
+
+
+def completion_id():
+    return f"chatcmpl-{uuid.uuid4().hex[:24]}"
+
+
+def completion_response(model, text, usage, response_id=None):
+    """A ``chat.completion`` object with a single stopped choice"""
+    return {
+        "id": response_id or completion_id(),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop",
+        }],
+        "usage": usage,
+    }
+
+
+def chunk_event(response_id, created, model, delta, finish_reason=None):
+    """One ``chat.completion.chunk`` as a server-sent event"""
+    payload = {
+        "id": response_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def error_body(message, error_type="server_error", code=None, param=None):
+    """The OpenAI error envelope, so SDK clients raise their usual exceptions"""
+    return {"error": {"message": message, "type": error_type, "param": param, "code": code}}
+
+
+DONE_EVENT = "data: [DONE]\n\n"
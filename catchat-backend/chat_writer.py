@@ -0,0 +1,302 @@
+import os
+import glob
+import json
+import fcntl
+import time
+import queue
+import threading
+import logging
+from datetime import datetime
+
+from mysql.connector import Error, errorcode
+from mysql.connector.errors import InterfaceError, OperationalError, PoolError
+
+from metrics import timed
+
+logger = logging.getLogger("catchat")
+
+INSERT_PREFIX = "INSERT INTO chat_history (user_id, message, response, timestamp) VALUES "
+# Timestamps are captured in UTC when the chat happens and converted on insert,
+# so rows keep their real time even if they are written late from the spill file
+ROW_PLACEHOLDER = "(%s, %s, %s, CONVERT_TZ(%s, '+00:00', @@session.time_zone))"
+# The database could not be reached, as opposed to refusing the rows themselves
+CONNECTIVITY_ERRORS = (InterfaceError, OperationalError, PoolError)
+# Errors that say nothing about the rows either; the same insert succeeds later
+TRANSIENT_ERRNOS = frozenset((errorcode.ER_LOCK_WAIT_TIMEOUT, errorcode.ER_LOCK_DEADLOCK))
+
+
+def is_transient(error):
+    """Whether a failed insert should be retried later rather than blamed on its rows"""
+    return isinstance(error, CONNECTIVITY_ERRORS) or getattr(error, "errno", None) in TRANSIENT_ERRNOS
+
+
+def _abandoned(path, spill_path):
+    """Whether a claimed replay file belongs to no running process"""
+    suffix = path[len(spill_path + ".replay"):]
+    if not suffix:
+        return True  # the pid-less name used before workers claimed files per process
+    try:
+        os.kill(int(suffix.lstrip(".")), 0)
+    except ValueError:
+        return False  # not one of ours
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+class ChatHistoryWriter:
+    """Write-behind persistence for chat_history.
+
+    ``save`` only appends the record to an in-memory queue. A background
+    thread flushes the queue with one multi-row INSERT whenever
+    ``batch_size`` records are waiting or ``flush_interval`` seconds have
+    passed. If MySQL is unavailable, or the insert ran into a lock wait
+    timeout or deadlock, the batch is appended to a local
+    JSON-lines spill file, which is replayed once inserts succeed again.
+    A batch MySQL rejects (bad data, a constraint) is retried row by row
+    and only the rows that fail on their own are dropped.
+
+    Every worker process appends to the same spill file. A replay first
+    claims it by renaming it to a name of its own, so only one worker
+    ever re-inserts a given record.
+    """
+
+    def __init__(self, pool, spill_path, batch_size=50, flush_interval=1.0, max_queue=10000,
+                 replay_interval=30, resolve_user_id=None):
+        self.pool = pool
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.replay_interval = replay_interval
+        self.resolve_user_id = resolve_user_id
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats_counters = {
+            "queued": 0,
+            "written": 0,
+            "batches": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "failed_batches": 0,
+            "rejected": 0,
+        }
+
+    def save(self, user_id, message, response=None, mode="standard"):
+        """Queue a chat record for writing; never blocks on the database"""
+        record = {
+            "user_id": user_id,
+            "message": message,
+            "response": response,
+            "mode": mode,
+            "timestamp": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        try:
+            self._queue.put_nowait(record)
+            self._count("queued")
+        except queue.Full:
+            logger.warning("Chat history queue is full, spilling record to disk")
+            self._spill([record])
+        return True
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="chat-history-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Stop the writer thread after flushing everything still queued"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _run(self):
+        # Pick up anything left over from a previous run
+        try:
+            self._replay()
+        except Exception as e:
+            logger.error(f"Error replaying spilled chat records: {e}", exc_info=True)
+        last_replay = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                batch = self._next_batch()
+                if batch and not self._flush(batch):
+                    continue
+                # A successful insert means MySQL is back; otherwise retry now and then
+                if os.path.exists(self.spill_path) and (batch or time.monotonic() - last_replay > self.replay_interval):
+                    last_replay = time.monotonic()
+                    self._replay()
+            except Exception as e:
+                # Whatever went wrong, the writer must outlive it or every later chat is lost
+                logger.error(f"Unexpected error in chat history writer, continuing: {e}", exc_info=True)
+                self._stop.wait(self.flush_interval)
+
+        remaining = self._drain()
+        for start in range(0, len(remaining), self.batch_size):
+            try:
+                self._flush(remaining[start:start + self.batch_size])
+            except Exception as e:
+                logger.error(f"Unexpected error flushing chat history on shutdown: {e}", exc_info=True)
+
+    def _insert(self, records):
+        rows = []
+        for record in records:
+            user_id = record["user_id"]
+            if self.resolve_user_id:
+                user_id = self.resolve_user_id(user_id)
+            rows.extend((user_id, record["message"], record["response"], record["timestamp"]))
+
+        query = INSERT_PREFIX + ", ".join([ROW_PLACEHOLDER] * len(records))
+        with timed("mysql_write"), self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(query, rows)
+                conn.commit()
+            finally:
+                cursor.close()
+
+    def _flush(self, batch):
+        """Insert a batch, spilling it to disk if the database is unavailable.
+
+        Returns False only when the insert failed for a reason unrelated to
+        the rows (no connection, a lock wait timeout or deadlock).
+        """
+        try:
+            self._insert(batch)
+        except Error as e:
+            self._count("failed_batches")
+            if is_transient(e):
+                logger.error(f"Error writing {len(batch)} chat records to MySQL, spilling to disk: {e}")
+                self._spill(batch)
+                return False
+            # Spilling would only replay the same failure forever; find the bad rows instead
+            logger.error(f"MySQL rejected a batch of {len(batch)} chat records, retrying them one by one: {e}")
+            return self._flush_rows(batch)
+        self._count("written", len(batch))
+        self._count("batches")
+        logger.debug("Wrote %d chat records to chat_history", len(batch))
+        return True
+
+    def _flush_rows(self, batch):
+        """Insert records one at a time, dropping the ones MySQL refuses"""
+        for index, record in enumerate(batch):
+            try:
+                self._insert([record])
+            except Error as e:
+                if is_transient(e):
+                    logger.error(f"Lost MySQL while writing chat records one by one, spilling the rest: {e}")
+                    self._spill(batch[index:])
+                    return False
+                self._count("rejected")
+                logger.error(f"Dropping chat record of user {record.get('user_id')} that MySQL rejected: {e}")
+                continue
+            self._count("written")
+        return True
+
+    def _count(self, name, amount=1):
+        with self._spill_lock:
+            self.stats_counters[name] += amount
+
+    def _open_spill(self):
+        """The spill file, opened for appending and locked against a replay claiming it meanwhile"""
+        while True:
+            spill = open(self.spill_path, "a", encoding="utf-8")
+            fcntl.flock(spill, fcntl.LOCK_EX)
+            try:
+                if os.fstat(spill.fileno()).st_ino == os.stat(self.spill_path).st_ino:
+                    return spill
+            except FileNotFoundError:
+                pass
+            # Another worker claimed the file between our open and lock; start a new one
+            spill.close()
+
+    def _spill(self, records):
+        try:
+            with self._spill_lock, self._open_spill() as spill:
+                for record in records:
+                    spill.write(json.dumps(record) + "\n")
+            self._count("spilled", len(records))
+        except OSError as e:
+            logger.error(f"Could not spill {len(records)} chat records to {self.spill_path}: {e}")
+
+    def _claim_spill(self):
+        """Take a spill file for replay by renaming it; returns the claimed path, or None.
+
+        Files left by a replay that died with its process are taken over
+        before the live spill file. os.rename is atomic, so when several
+        workers race for the same file exactly one of them gets it.
+        """
+        claimed = f"{self.spill_path}.replay.{os.getpid()}"
+        if os.path.exists(claimed):
+            # Our own replay was interrupted (or a previous process had our pid); finish it first
+            return claimed
+        orphans = glob.glob(glob.escape(self.spill_path) + ".replay*")
+        for path in orphans + [self.spill_path]:
+            if path in orphans and not _abandoned(path, self.spill_path):
+                continue
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue  # another worker got there first
+            return claimed
+        return None
+
+    def _replay(self):
+        """Re-insert spilled records; anything that still fails is spilled again"""
+        replaying = self._claim_spill()
+        if replaying is None:
+            return
+
+        records = []
+        with open(replaying, encoding="utf-8") as spill:
+            # Wait for appends that opened the file before it was renamed
+            fcntl.flock(spill, fcntl.LOCK_SH)
+            for line in spill:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A torn final line from a crash mid-write
+                    logger.warning("Skipping unreadable line in chat history spill file")
+        logger.info(f"Replaying {len(records)} spilled chat records")
+
+        for start in range(0, len(records), self.batch_size):
+            batch = records[start:start + self.batch_size]
+            if not self._flush(batch):
+                # Database went away again; keep the rest for the next attempt
+                self._spill(records[start + self.batch_size:])
+                break
+            self._count("replayed", len(batch))
+        os.remove(replaying)
+
+    def stats(self):
+        with self._spill_lock:
+            snapshot = dict(self.stats_counters)
+        snapshot["pending"] = self._queue.qsize()
+        snapshot["spill_file"] = os.path.exists(self.spill_path)
+        return snapshot
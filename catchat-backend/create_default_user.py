@@ -2,6 +2,7 @@ import mysql.connector
 from mysql.connector import Error
 from dotenv import load_dotenv
 import os
+import requests
 
 # Load environment variables
 load_dotenv()
@@ -14,6 +15,26 @@ MYSQL_CONFIG = {
     'database': os.getenv('MYSQL_DATABASE')
 }
 
+def notify_backend(user_id):
+    """Tell a running backend to drop its cached lookups of this user.
+
+    Only the worker process that receives the call is invalidated; other
+    workers keep a cached "no such user" until USER_CACHE_NEGATIVE_TTL
+    (30 seconds by default) runs out.
+    """
+    backend_url = os.getenv("CATCHAT_BACKEND_URL", "http://localhost:8000")
+    try:
+        response = requests.post(
+            f"{backend_url}/internal/user-cache/invalidate", params={"user_id": user_id}, timeout=2
+        )
+        response.raise_for_status()
+        print("Backend user cache invalidated (in the worker that took the call; others expire on their own)")
+    except requests.HTTPError as e:
+        print(f"Backend refused the user cache invalidation ({e.response.status_code}); "
+              "its user cache will expire on its own")
+    except requests.RequestException:
+        print("Backend not reachable; its user cache will expire on its own")
+
 def create_default_user():
     try:
         print("Connecting to MySQL...")
@@ -42,6 +63,7 @@ def create_default_user():
             cursor.close()
             connection.close()
             print("MySQL connection closed")
+            notify_backend(cursor.lastrowid)
             return cursor.lastrowid
     except Error as e:
         print(f"Error: {e}")
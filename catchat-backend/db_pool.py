@@ -0,0 +1,162 @@
+import time
+import queue
+import threading
+import logging
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+from mysql.connector.errors import InterfaceError, PoolError
+
+logger = logging.getLogger("catchat")
+
+
+class _PooledConnection:
+    """A raw connection plus the bookkeeping the pool needs to recycle it"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class MySQLPool:
+    """Bounded, health-checked pool of mysql.connector connections.
+
+    At most ``size`` connections exist at once; a checkout waits up to
+    ``timeout`` seconds for one to free up and then raises PoolError.
+    Connections older than ``recycle`` seconds are replaced, and idle
+    connections are pinged before reuse once they have been idle for
+    ``ping_interval`` seconds.
+    """
+
+    def __init__(self, config, size=10, timeout=5.0, recycle=3600, ping_interval=30):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            "created": 0,
+            "recycled": 0,
+            "discarded": 0,
+            "checkouts": 0,
+            "timeouts": 0,
+            "in_use": 0,
+            "waiting": 0,
+            "wait_time_total": 0.0,
+        }
+
+    def _bump(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.config)
+        self._bump("created")
+        logger.info("Opened pooled MySQL connection")
+        return _PooledConnection(conn)
+
+    def _close(self, entry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, entry):
+        now = time.monotonic()
+        if self.recycle and now - entry.created_at > self.recycle:
+            self._bump("recycled")
+            return False
+        if now - entry.last_used > self.ping_interval:
+            try:
+                entry.conn.ping(reconnect=False)
+            except Error:
+                self._bump("discarded")
+                return False
+        return True
+
+    def _checkout(self, timeout):
+        self._bump("waiting")
+        started = time.monotonic()
+        acquired = self._slots.acquire(timeout=timeout)
+        self._bump("waiting", -1)
+        self._bump("wait_time_total", time.monotonic() - started)
+        if not acquired:
+            self._bump("timeouts")
+            raise PoolError(msg=f"Timed out after {timeout}s waiting for a MySQL connection")
+
+        try:
+            while True:
+                try:
+                    entry = self._idle.get_nowait()
+                except queue.Empty:
+                    entry = self._connect()
+                    break
+                if self._is_healthy(entry):
+                    break
+                self._close(entry)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+        return entry
+
+    def _checkin(self, entry, broken=False):
+        with self._lock:
+            self._stats["in_use"] -= 1
+        try:
+            # No is_connected() here: it is a server round trip on every query, and a
+            # dead connection is caught by the idle ping at its next checkout anyway
+            if broken or self._closed:
+                self._bump("discarded")
+                self._close(entry)
+                return
+            # Never hand the next caller an open transaction
+            if entry.conn.in_transaction:
+                entry.conn.rollback()
+            entry.last_used = time.monotonic()
+            self._idle.put(entry)
+        except Error:
+            self._bump("discarded")
+            self._close(entry)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Check out a connection for the duration of a ``with`` block"""
+        entry = self._checkout(self.timeout if timeout is None else timeout)
+        broken = False
+        try:
+            yield entry.conn
+        except Error as e:
+            # Connection-level failures leave the socket unusable
+            broken = isinstance(e, InterfaceError) or getattr(e, "errno", None) in (2006, 2013, 2055)
+            raise
+        finally:
+            self._checkin(entry, broken=broken)
+
+    def stats(self):
+        """Snapshot of pool usage counters"""
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot["size"] = self.size
+        snapshot["idle"] = self._idle.qsize()
+        return snapshot
+
+    def close(self):
+        """Close every idle connection; checked-out ones are closed on return"""
+        self._closed = True
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                break
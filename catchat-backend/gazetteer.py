@@ -0,0 +1,170 @@
+"""Gazetteer lookup for place names in free text.
+
+Every known name and alias is compiled into one Aho-Corasick automaton,
+so a message is scanned for all places in a single pass regardless of
+how many names are loaded. A hit must sit on word boundaries ("rio"
+never matches inside "period"), and overlapping hits resolve to the
+leftmost, then longest, name ("new york city" wins over "new york").
+
+The place list is a tab-separated file of ``canonical<TAB>alias|alias``
+lines. Whatever alias matched, the canonical form is returned, so
+"NYC weather" and "weather in new york city" both resolve to the same
+key for the weather lookups and their cache.
+
+``extract_location`` is what the weather path uses: a place the user
+spelled out ("weather in Portland, Maine") is taken as written and only
+canonicalized when the gazetteer knows it as a whole, so an ambiguous
+bare name in the list never overrides the qualifier the user typed.
+"""
+import re
+import logging
+from collections import deque
+
+logger = logging.getLogger("catchat")
+
+# Explicit "weather in ..." phrasing; the first group is the location as typed
+LOCATION_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    r"weather (?:in|for|at) (.+?)(?:\?|$|\s+on\b)",
+    r"(?:what's|what is) the weather (?:in|at|for) (.+?)(?:\?|$)",
+    r"forecast (?:in|for|at) (.+?)(?:\?|$)",
+    r"temperature (?:in|for|at) (.+?)(?:\?|$)",
+]]
+# When-words that trail a typed location ("weather in nyc today") and are not part of it
+TRAILING_TIME = re.compile(
+    r"(?:\s+(?:today|tonight|tomorrow|now|right now|currently|this (?:morning|afternoon|evening|week|weekend)))+$",
+    re.IGNORECASE,
+)
+
+
+class Gazetteer:
+    """Aho-Corasick automaton mapping place names to a canonical location"""
+
+    def __init__(self, places):
+        """``places`` maps canonical location -> iterable of aliases"""
+        # Node 0 is the root; each node has transitions, a failure link and
+        # the (name length, canonical) outputs that end there, longest first
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        self.name_count = 0
+        for canonical, aliases in places.items():
+            for name in {canonical, *aliases}:
+                self._add(self._normalize(name), canonical)
+        self._link()
+
+    @staticmethod
+    def _normalize(name):
+        return " ".join(name.lower().split())
+
+    @classmethod
+    def from_file(cls, path):
+        places = {}
+        with open(path, encoding="utf-8") as source:
+            for line in source:
+                line = line.rstrip("\n")
+                if not line.strip() or line.startswith("#"):
+                    continue
+                canonical, _, aliases = line.partition("\t")
+                canonical = canonical.strip()
+                places.setdefault(canonical, set()).update(
+                    alias.strip() for alias in aliases.split("|") if alias.strip()
+                )
+        gazetteer = cls(places)
+        logger.info(f"Loaded gazetteer with {gazetteer.name_count} names for {len(places)} places from {path}")
+        return gazetteer
+
+    def _add(self, name, canonical):
+        if not name:
+            return
+        node = 0
+        for char in name:
+            following = self._goto[node].get(char)
+            if following is None:
+                following = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+                self._goto[node][char] = following
+            node = following
+        if not self._out[node]:
+            self.name_count += 1
+            self._out[node] = ((len(name), canonical),)
+
+    def _link(self):
+        """Compute failure links breadth-first and merge outputs along them"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, following in self._goto[node].items():
+                queue.append(following)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[following] = target if target != following else 0
+                if self._out[self._fail[following]]:
+                    self._out[following] = tuple(sorted(
+                        self._out[following] + self._out[self._fail[following]], reverse=True
+                    ))
+
+    def find_all(self, text):
+        """Return non-overlapping ``(start, end, canonical)`` matches in order"""
+        text = text.lower()
+        goto, fail, out = self._goto, self._fail, self._out
+        candidates = []
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if not out[node]:
+                continue
+            # Only names that start and end on a word boundary count
+            if end < len(text) and text[end].isalnum():
+                continue
+            for length, canonical in out[node]:
+                start = end - length
+                if start == 0 or not text[start - 1].isalnum():
+                    candidates.append((start, -end, canonical))
+
+        matches = []
+        last_end = 0
+        for start, neg_end, canonical in sorted(candidates):
+            if start >= last_end:
+                matches.append((start, -neg_end, canonical))
+                last_end = -neg_end
+        return matches
+
+    def find(self, text):
+        """Return the canonical location of the first place named in ``text``, or None"""
+        matches = self.find_all(" ".join(text.split()))
+        return matches[0][2] if matches else None
+
+    def lookup(self, name):
+        """Return the canonical location if ``name`` as a whole is a known name or alias, else None"""
+        name = self._normalize(name)
+        node = 0
+        for char in name:
+            node = self._goto[node].get(char)
+            if node is None:
+                return None
+        for length, canonical in self._out[node]:
+            if length == len(name):
+                return canonical
+        return None
+
+
+def extract_location(text, gazetteer, patterns=LOCATION_PATTERNS):
+    """The location a message asks about, or None.
+
+    An explicit "weather in ..." capture wins and is canonicalized only
+    if the gazetteer knows all of it; the gazetteer is scanned over the
+    whole message only when no pattern matches.
+    """
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            location = TRAILING_TIME.sub("", " ".join(match.group(1).split())).rstrip(".,!")
+            if location:
+                return gazetteer.lookup(location) or location
+    return gazetteer.find(text)
@@ -0,0 +1,130 @@
+"""Reading a user's chat_history without OFFSET scans.
+
+Pages are ordered newest first by ``(timestamp, id)`` and continue from
+an opaque cursor holding the last row's position, so every page is an
+index range scan on ``idx_user_timestamp`` no matter how deep it is.
+Exports read the same range through an unbuffered (server-side)
+cursor in batches, so memory use does not grow with the user's history.
+"""
+import json
+import base64
+import logging
+from datetime import datetime
+
+from mysql.connector import Error
+
+logger = logging.getLogger("catchat")
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+PAGE_QUERY = (
+    "SELECT id, message, response, timestamp FROM chat_history "
+    "WHERE user_id = %s{seek} "
+    "ORDER BY timestamp DESC, id DESC LIMIT %s"
+)
+# Written as a range on timestamp plus a tie-break on id so MySQL can
+# use the index range; a row-constructor comparison may not be
+SEEK_CONDITION = " AND timestamp <= %s AND (timestamp < %s OR id < %s)"
+
+EXPORT_QUERY = (
+    "SELECT id, message, response, timestamp FROM chat_history "
+    "WHERE user_id = %s{since}{until} "
+    "ORDER BY timestamp, id"
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, row_id):
+    raw = json.dumps([timestamp.strftime(TIMESTAMP_FORMAT), row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        timestamp, row_id = json.loads(raw)
+        return datetime.strptime(timestamp, TIMESTAMP_FORMAT), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid history cursor") from e
+
+
+def _row(row):
+    row_id, message, response, timestamp = row
+    return {
+        "id": row_id,
+        "message": message,
+        "response": response,
+        "timestamp": timestamp.strftime(TIMESTAMP_FORMAT) if timestamp else None,
+    }
+
+
+def fetch_history_page(pool, user_id, limit=50, cursor=None):
+    """One page of a user's chats, newest first, plus the cursor for the next page (or None)"""
+    params = [user_id]
+    seek = ""
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        seek = SEEK_CONDITION
+        params += [timestamp, timestamp, row_id]
+    # One extra row tells us whether another page exists
+    params.append(limit + 1)
+
+    with pool.connection() as conn:
+        db_cursor = conn.cursor()
+        try:
+            db_cursor.execute(PAGE_QUERY.format(seek=seek), params)
+            rows = db_cursor.fetchall()
+        finally:
+            db_cursor.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][3], rows[-1][0])
+    return [_row(row) for row in rows], next_cursor
+
+
+def export_history_ndjson(pool, user_id, since=None, until=None, batch_size=500, net_write_timeout=600):
+    """Yield a user's chats oldest first as NDJSON chunks, one batch of lines at a time.
+
+    The pooled connection is held until the generator finishes. If the
+    consumer stops early the connection is closed instead of returned,
+    since unread rows would still be pending on it.
+    """
+    params = [user_id]
+    since_clause = until_clause = ""
+    if since:
+        since_clause = " AND timestamp >= %s"
+        params.append(since)
+    if until:
+        until_clause = " AND timestamp < %s"
+        params.append(until)
+
+    with pool.connection() as conn:
+        finished = False
+        db_cursor = conn.cursor()
+        try:
+            # A slow client must not make the server give up on sending rows
+            db_cursor.execute("SET SESSION net_write_timeout = %s", (net_write_timeout,))
+            db_cursor.execute(EXPORT_QUERY.format(since=since_clause, until=until_clause), params)
+            exported = 0
+            while True:
+                rows = db_cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                exported += len(rows)
+                yield "".join(json.dumps(_row(row), ensure_ascii=False) + "\n" for row in rows)
+            finished = True
+            db_cursor.execute("SET SESSION net_write_timeout = DEFAULT")
+            logger.info(f"Exported {exported} chat records for user {user_id}")
+        finally:
+            if finished:
+                db_cursor.close()
+            else:
+                try:
+                    conn.close()
+                except Error:
+                    pass
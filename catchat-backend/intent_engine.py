@@ -0,0 +1,198 @@
+import re
+import threading
+import logging
+
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+logger = logging.getLogger("catchat")
+
+# Literals shorter than this are too common to be worth gating on
+MIN_GATE_LENGTH = 3
+
+
+def _required_literals(parsed):
+    """Collect literal runs that must appear in any string matched by a parsed pattern"""
+    literals = []
+    current = []
+
+    def flush():
+        if current:
+            literals.append("".join(current))
+            current.clear()
+
+    for op, arg in parsed:
+        if op is sre_parse.LITERAL:
+            current.append(chr(arg))
+            continue
+        flush()
+        if op is sre_parse.SUBPATTERN:
+            # (group, add_flags, del_flags, pattern)
+            literals.extend(_required_literals(arg[-1]))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and arg[0] >= 1:
+            literals.extend(_required_literals(arg[2]))
+    flush()
+    return literals
+
+
+def _has_group_references(parsed):
+    """Check whether a parsed pattern uses backreferences or conditional groups"""
+    for op, arg in parsed:
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            return True
+        if op is sre_parse.SUBPATTERN and _has_group_references(arg[-1]):
+            return True
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and _has_group_references(arg[2]):
+            return True
+        if op is sre_parse.BRANCH and any(_has_group_references(b) for b in arg[1]):
+            return True
+    return False
+
+
+class CompiledIntent:
+    """A single quantum_intent_mapping row with its patterns compiled"""
+
+    def __init__(self, row):
+        self.id = row.get('id')
+        self.application_id = row['quantum_application_id']
+        self.confidence = row['confidence_threshold']
+        self.pattern = row['intent_pattern']
+        self.regex = re.compile(self.pattern, re.IGNORECASE)
+        self.parameter_regex = None
+        if row.get('parameter_extraction_pattern'):
+            self.parameter_regex = re.compile(row['parameter_extraction_pattern'], re.IGNORECASE)
+
+        # Gate on the longest literal the pattern cannot match without
+        self.gate = None
+        self.combinable = False
+        try:
+            parsed = sre_parse.parse(self.pattern, re.IGNORECASE)
+            literals = [lit.lower() for lit in _required_literals(parsed) if len(lit) >= MIN_GATE_LENGTH]
+            if literals:
+                self.gate = max(literals, key=len)
+            self.combinable = not _has_group_references(parsed)
+        except Exception as e:
+            logger.debug("Could not analyse intent pattern %r: %s", self.pattern, e)
+
+    def extract_parameters(self, message):
+        if not self.parameter_regex:
+            return None
+        param_match = self.parameter_regex.search(message)
+        if param_match and param_match.groups():
+            return param_match.group(1)
+        return None
+
+
+class IntentEngine:
+    """In-memory matcher for quantum intents.
+
+    Patterns are loaded from quantum_intent_mapping once and compiled up
+    front. A combined regex rejects messages that match no pattern in a
+    single pass; otherwise each candidate is gated on a required literal
+    before its own regex runs, and the highest-confidence match wins.
+    The mapping is reloaded when ``load_version`` reports a change.
+    Until a load succeeds no intents are served, and the background poll
+    keeps retrying; ``match`` itself never touches the database.
+    """
+
+    def __init__(self, load_rows, load_version, refresh_interval=30):
+        self._load_rows = load_rows
+        self._load_version = load_version
+        self.refresh_interval = refresh_interval
+        self._state = ([], None)  # (compiled intents, combined prefilter)
+        self._version = None
+        self._loaded = False
+        self._attempted = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reload(self):
+        """Load and compile all intent patterns, replacing the current set"""
+        version = self._load_version()
+        rows = self._load_rows()
+        if rows is None:
+            if self._attempted:
+                logger.debug("Intent mapping could not be loaded; keeping previous patterns")
+            else:
+                logger.warning("Intent mapping could not be loaded; serving no intents until it can be")
+            self._attempted = True
+            return False
+
+        intents = []
+        for row in rows:
+            try:
+                intents.append(CompiledIntent(row))
+            except re.error as e:
+                logger.error(f"Skipping invalid intent pattern {row.get('intent_pattern')!r}: {e}")
+
+        prefilter = None
+        if intents and all(intent.combinable for intent in intents):
+            try:
+                prefilter = re.compile("|".join(f"(?:{intent.pattern})" for intent in intents), re.IGNORECASE)
+            except re.error as e:
+                logger.debug("Combined intent prefilter unavailable: %s", e)
+
+        # Swap in the new state in one assignment so readers never see a partial set
+        with self._lock:
+            self._state = (intents, prefilter)
+            self._version = version
+            self._loaded = True
+            self._attempted = True
+        logger.info(f"Loaded {len(intents)} quantum intent patterns (prefilter={'on' if prefilter else 'off'})")
+        return True
+
+    def refresh_if_changed(self):
+        """Reload the patterns if the mapping table has changed, or has never loaded"""
+        if not self._loaded:
+            return self.reload()
+        version = self._load_version()
+        if version is None or version == self._version:
+            return False
+        logger.info("quantum_intent_mapping changed, reloading intent patterns")
+        return self.reload()
+
+    def start_auto_reload(self):
+        """Poll for table changes in a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="intent-engine-reload", daemon=True)
+        self._thread.start()
+
+    def stop_auto_reload(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh_if_changed()
+            except Exception as e:
+                logger.error(f"Error refreshing intent patterns: {e}")
+
+    def match(self, message):
+        """Return the best-confidence intent for a message, or None"""
+        intents, prefilter = self._state
+        if prefilter is not None and not prefilter.search(message):
+            return None
+
+        message_lower = message.lower()
+        best = None
+        for intent in intents:
+            if best is not None and intent.confidence <= best.confidence:
+                continue
+            if intent.gate and intent.gate not in message_lower:
+                continue
+            if intent.regex.search(message_lower):
+                best = intent
+
+        if best is None:
+            return None
+
+        return {
+            'application_id': best.application_id,
+            'confidence': best.confidence,
+            'parameters': best.extract_parameters(message)
+        }
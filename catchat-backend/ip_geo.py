@@ -0,0 +1,260 @@
+"""Offline IPv4 geolocation.
+
+An IP-range CSV is compiled once into a compact binary file. The
+default layout is DB-IP's dbip-city-lite.csv, which has no header
+(``ip_start,ip_end,continent,country,stateprov,city,latitude,longitude``);
+a CSV with a header row is read by column name instead (``country``,
+``region`` or ``stateprov``, ``city``). IPv6 rows are skipped.
+
+    header   8-byte magic, uint32 range count, uint32 location count
+    ranges   count x (uint32 start, uint32 end, uint32 location index), sorted by start
+    offsets  (location count + 1) x uint32 byte offsets into the string block
+    strings  UTF-8 location names, e.g. "Boston, Massachusetts" or "Paris"
+
+The file is memory-mapped read-only, so every worker process shares the
+same pages, and lookups are a bisect over the range starts.
+
+Build an index with:
+
+    python ip_geo.py build dbip-city-lite.csv ip_geo.bin
+"""
+import os
+import sys
+import csv
+import mmap
+import struct
+import bisect
+import logging
+import ipaddress
+
+import httpx
+
+from ttl_cache import TTLCache
+from metrics import timed
+
+logger = logging.getLogger("catchat")
+
+MAGIC = b"CATGEO1\0"
+HEADER = struct.Struct("<8sII")
+RANGE = struct.Struct("<III")
+OFFSET = struct.Struct("<I")
+
+# Column positions of country, region and city in dbip-city-lite.csv
+DBIP_COLUMNS = (3, 4, 5)
+# Header names accepted for each of them in other CSVs
+HEADER_NAMES = (
+    ("country", "country_code"),
+    ("region", "stateprov", "state"),
+    ("city",),
+)
+
+# Default location for local and private addresses during development
+DEVELOPMENT_LOCATION = "New York"
+
+
+def format_location(city, region, country):
+    """Format a location the way the weather lookups expect it"""
+    if not city:
+        return None
+    if country == 'US' and region:
+        return f"{city}, {region}"
+    return city
+
+
+def _header_columns(row):
+    """(country, region, city) positions named by a header row, or None if ``row`` is not one"""
+    names = [name.strip().lower() for name in row]
+    columns = []
+    for candidates in HEADER_NAMES:
+        position = next((names.index(name) for name in candidates if name in names), None)
+        if position is None:
+            return None
+        columns.append(position)
+    return tuple(columns)
+
+
+def build_index(csv_path, out_path):
+    """Compile an IP-range CSV into the binary index format"""
+    ranges = []
+    locations = {}
+    country_at, region_at, city_at = DBIP_COLUMNS
+    with open(csv_path, newline="", encoding="utf-8") as source:
+        for line_number, row in enumerate(csv.reader(source)):
+            if line_number == 0:
+                header = _header_columns(row)
+                if header is not None:
+                    country_at, region_at, city_at = header
+                    continue
+            if len(row) <= max(country_at, region_at, city_at):
+                continue
+            try:
+                start = ipaddress.ip_address(row[0].strip())
+                end = ipaddress.ip_address(row[1].strip())
+            except ValueError:
+                continue  # malformed row
+            if start.version != 4 or end.version != 4:
+                continue
+            location = format_location(row[city_at].strip(), row[region_at].strip(), row[country_at].strip())
+            if not location:
+                continue
+            index = locations.setdefault(location, len(locations))
+            ranges.append((int(start), int(end), index))
+
+    ranges.sort()
+    names = [name.encode("utf-8") for name, _ in sorted(locations.items(), key=lambda item: item[1])]
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, len(ranges), len(names)))
+        for record in ranges:
+            out.write(RANGE.pack(*record))
+        offset = 0
+        for name in names:
+            out.write(OFFSET.pack(offset))
+            offset += len(name)
+        out.write(OFFSET.pack(offset))
+        for name in names:
+            out.write(name)
+    # Replace atomically so running workers never map a half-written file
+    os.replace(tmp_path, out_path)
+    return len(ranges), len(names)
+
+
+class _RangeStarts:
+    """Sequence view of the range start addresses, for bisect"""
+
+    def __init__(self, buffer, count):
+        self._buffer = buffer
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        return struct.unpack_from("<I", self._buffer, HEADER.size + i * RANGE.size)[0]
+
+
+class IPRangeIndex:
+    """Read-only, memory-mapped view of a compiled IP-range index"""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.range_count, self.location_count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not an IP geolocation index")
+        self._offsets_at = HEADER.size + self.range_count * RANGE.size
+        self._strings_at = self._offsets_at + (self.location_count + 1) * OFFSET.size
+        self._starts = _RangeStarts(self._map, self.range_count)
+
+    def _location(self, index):
+        start, end = struct.unpack_from("<II", self._map, self._offsets_at + index * OFFSET.size)
+        return self._map[self._strings_at + start:self._strings_at + end].decode("utf-8")
+
+    def lookup(self, ip_address):
+        """Return the location for an IPv4 address, or None if it is not covered"""
+        try:
+            address = ipaddress.IPv4Address(ip_address)
+        except ValueError:
+            return None
+        value = int(address)
+        position = bisect.bisect_right(self._starts, value) - 1
+        if position < 0:
+            return None
+        start, end, location_index = RANGE.unpack_from(self._map, HEADER.size + position * RANGE.size)
+        if value > end:
+            return None
+        return self._location(location_index)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class IPLocator:
+    """Resolve client IPs to a weather location.
+
+    Uses the local index when one is available and falls back to
+    ipinfo.io otherwise. Results, including misses, are kept in an LRU
+    cache per IP.
+    """
+
+    def __init__(self, index_path=None, cache_size=10000, cache_ttl=86400, fallback_timeout=3):
+        self.index = None
+        if index_path and os.path.exists(index_path):
+            try:
+                self.index = IPRangeIndex(index_path)
+                logger.info(f"Loaded IP geolocation index with {self.index.range_count} ranges from {index_path}")
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not load IP geolocation index {index_path}: {e}")
+        else:
+            logger.warning("No IP geolocation index found, falling back to ipinfo.io lookups")
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.fallback_timeout = fallback_timeout
+        self._http = None
+
+    @staticmethod
+    def _is_local(ip_address):
+        if ip_address == 'localhost':
+            return True
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return False
+        return address.is_private or address.is_loopback
+
+    async def _lookup_remote(self, ip_address):
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=self.fallback_timeout)
+        response = await self._http.get(f"https://ipinfo.io/{ip_address}/json")
+        if response.status_code != 200:
+            logger.error(f"IP lookup failed with status: {response.status_code}")
+            return None
+        data = response.json()
+        location = format_location(data.get('city'), data.get('region'), data.get('country'))
+        if not location:
+            logger.warning(f"No city found in IP data: {data}")
+        return location
+
+    async def locate(self, ip_address):
+        """Get a location name for an IP address, or None"""
+        if self._is_local(ip_address):
+            logger.warning(f"Skipping local/private IP: {ip_address}")
+            return DEVELOPMENT_LOCATION
+
+        with timed("ip_lookup"):
+            cached = self.cache.get(ip_address, default=False)
+            if cached is not False:
+                return cached
+
+            if self.index is not None:
+                location = self.index.lookup(ip_address)
+            else:
+                try:
+                    location = await self._lookup_remote(ip_address)
+                except httpx.HTTPError as e:
+                    # Transient failures are not cached
+                    logger.error(f"Error in IP geolocation: {e}")
+                    return None
+
+            self.cache.set(ip_address, location)
+            return location
+
+    def stats(self):
+        return {
+            "index_ranges": self.index.range_count if self.index else 0,
+            "cache": self.cache.stats(),
+        }
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "build":
+        print("Usage: python ip_geo.py build <ip-ranges.csv> <output.bin>")
+        sys.exit(1)
+    range_count, location_count = build_index(sys.argv[2], sys.argv[3])
+    print(f"Wrote {range_count} ranges and {location_count} locations to {sys.argv[3]}")
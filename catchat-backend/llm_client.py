@@ -0,0 +1,119 @@
+import time
+import asyncio
+import logging
+import httpx
+from openai import AsyncOpenAI
+
+from metrics import timed, STAGE_SECONDS
+
+logger = logging.getLogger("catchat")
+
+
+class LLMClient:
+    """Async OpenAI chat client with a global cap on in-flight requests.
+
+    Calls beyond ``max_in_flight`` wait in a FIFO queue instead of opening
+    more upstream requests; ``stats()`` reports how deep that queue is.
+    """
+
+    def __init__(self, api_key, max_in_flight=32, timeout=15):
+        # Keep a warm connection for every slot; the SDK default keeps only 20
+        # alive, so bursts above that reconnected to OpenAI on every call
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            timeout=timeout,
+            http_client=httpx.AsyncClient(
+                timeout=timeout,
+                limits=httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+            )
+        )
+        self.max_in_flight = max_in_flight
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def _acquire(self):
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def _release(self, ok):
+        self.in_flight -= 1
+        self._semaphore.release()
+        if ok:
+            self.completed += 1
+        else:
+            self.failed += 1
+
+    async def chat(self, **kwargs):
+        """Create a chat completion once a concurrency slot is free"""
+        await self._acquire()
+        started = time.monotonic()
+        ok = False
+        try:
+            with timed("openai_call"):
+                response = await self.client.chat.completions.create(**kwargs)
+            ok = True
+            return response
+        finally:
+            self._release(ok)
+            logger.debug("OpenAI call finished in %.2fs (ok=%s)", time.monotonic() - started, ok)
+
+    async def stream_chunks(self, **kwargs):
+        """Yield the raw chunks of a streamed chat completion.
+
+        The concurrency slot is held until the stream is exhausted or closed.
+        """
+        await self._acquire()
+        started = time.monotonic()
+        ok = False
+        stream = None
+        first_token = True
+        try:
+            with timed("openai_stream"):
+                stream = await self.client.chat.completions.create(stream=True, **kwargs)
+                async for chunk in stream:
+                    if first_token and chunk.choices and chunk.choices[0].delta.content:
+                        STAGE_SECONDS.observe(time.monotonic() - started, "openai_first_token")
+                        first_token = False
+                    yield chunk
+            ok = True
+        finally:
+            # Free the slot before awaiting anything: a consumer that hung up
+            # closes this generator from a cancelled task
+            self._release(ok)
+            logger.debug("OpenAI stream finished in %.2fs (ok=%s)", time.monotonic() - started, ok)
+            if stream is not None:
+                # Release the upstream connection if the consumer stopped early
+                await stream.response.aclose()
+
+    async def stream(self, **kwargs):
+        """Yield the content deltas of a streamed chat completion"""
+        chunks = self.stream_chunks(**kwargs)
+        try:
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await chunks.aclose()
+
+    def stats(self):
+        """Concurrency and queue-depth counters"""
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    async def close(self):
+        await self.client.close()
@@ -0,0 +1,12 @@
+"""Load testing the backend without touching OpenAI, Visual Crossing or production MySQL.
+
+    python -m loadtest.run --concurrency 32 --duration 60
+    python -m loadtest.replay chat_history.ndjson --speed 10x
+    python -m loadtest.fake_upstreams openai --port 9101 --latency lognormal:0.8,0.4
+
+``run`` boots fake upstreams (``fake_upstreams``), weather_api.py and
+app.py as local processes (``stack``), drives /chat with a synthetic
+mix and prints per-route throughput and latency percentiles (``stats``).
+``replay`` sends captured traffic through the same stack with its
+recorded timing.
+"""
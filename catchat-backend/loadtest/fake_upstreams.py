@@ -0,0 +1,271 @@
+"""Local stand-ins for the OpenAI chat and audio APIs and the Visual Crossing timeline API.
+
+    python -m loadtest.fake_upstreams openai --port 9101 --latency lognormal:0.8,0.4 --error-rate 0.01
+    python -m loadtest.fake_upstreams weather --port 9102 --latency uniform:0.05,0.2
+
+Point the backend at them with OPENAI_BASE_URL=http://127.0.0.1:9101/v1
+and VISUAL_CROSSING_BASE_URL=http://127.0.0.1:9102. Latency specs:
+
+    fixed:S              always S seconds
+    uniform:LO,HI        uniformly between LO and HI seconds
+    lognormal:MEDIAN,SIGMA
+    exponential:MEAN
+
+Each server counts what it answered on GET /_stats.
+"""
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "qubit superposition forecast entanglement gate circuit cloud humidity pressure front "
+    "measurement noise error correction coherence sample result breeze sunny decoherence"
+).split()
+
+
+def parse_latency(spec):
+    """A function returning one latency sample in seconds for a spec such as ``lognormal:0.8,0.4``"""
+    kind, _, raw = (spec or "fixed:0").partition(":")
+    try:
+        values = [float(value) for value in raw.split(",")] if raw else []
+        if kind == "fixed" and len(values) == 1:
+            delay = values[0]
+            return lambda: delay
+        if kind == "uniform" and len(values) == 2:
+            low, high = values
+            return lambda: random.uniform(low, high)
+        if kind == "lognormal" and len(values) == 2:
+            median, sigma = values
+            return lambda: random.lognormvariate(math.log(median), sigma)
+        if kind == "exponential" and len(values) == 1:
+            mean = values[0]
+            return lambda: random.expovariate(1 / mean)
+    except (ValueError, ZeroDivisionError):
+        pass
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+class FaultProfile:
+    """How slow and how unreliable a fake upstream is"""
+
+    def __init__(self, latency="fixed:0", error_rate=0.0, error_status=500):
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    async def delay(self):
+        seconds = self.sample_latency()
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def should_fail(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+def _stats_app(title):
+    app = FastAPI(title=title)
+    app.state.counts = Counter()
+
+    @app.get("/_stats")
+    async def stats():
+        return dict(app.state.counts)
+
+    return app
+
+
+def _reply_text(words):
+    body = [random.choice(WORDS) for _ in range(max(words, 4))]
+    split = max(2, len(body) // 5)
+    return f"Summary: {' '.join(body[:split]).capitalize()}.\nDetails: {' '.join(body[split:]).capitalize()}."
+
+
+def create_openai_app(profile, reply_words=60, token_interval=0.01):
+    """Chat completions in the OpenAI wire format, streamed or not, plus transcription and speech"""
+    app = _stats_app("Fake OpenAI")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stream = bool(body.get("stream"))
+        await profile.delay()
+        if profile.should_fail():
+            app.state.counts["errors"] += 1
+            return JSONResponse(
+                {"error": {"message": "Injected failure", "type": "server_error", "code": None}},
+                status_code=profile.error_status
+            )
+
+        app.state.counts["streamed" if stream else "completions"] += 1
+        completion_id = f"chatcmpl-fake{random.getrandbits(48):012x}"
+        created = int(time.time())
+        model = body.get("model", "gpt-4-turbo")
+        words = min(reply_words, int(body.get("max_tokens") or reply_words))
+        text = _reply_text(words)
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", [])) // 4
+
+        if not stream:
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": words,
+                    "total_tokens": prompt_tokens + words,
+                },
+            }
+
+        def chunk(delta, finish_reason=None):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            yield chunk({"role": "assistant", "content": ""})
+            for index, token in enumerate(text.split(" ")):
+                if token_interval > 0:
+                    await asyncio.sleep(token_interval)
+                yield chunk({"content": token if index == 0 else " " + token})
+            yield chunk({}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions(request: Request):
+        form = await request.form()
+        audio = form.get("file")
+        size = len(await audio.read()) if audio is not None else 0
+        await profile.delay()
+        if profile.should_fail():
+            app.state.counts["errors"] += 1
+            return JSONResponse(
+                {"error": {"message": "Injected failure", "type": "server_error", "code": None}},
+                status_code=profile.error_status
+            )
+        app.state.counts["transcriptions"] += 1
+        return {"text": f"Transcribed {size} bytes of {getattr(audio, 'filename', 'audio')}."}
+
+    @app.post("/v1/audio/speech")
+    async def speech(request: Request):
+        body = await request.json()
+        await profile.delay()
+        if profile.should_fail():
+            app.state.counts["errors"] += 1
+            return JSONResponse(
+                {"error": {"message": "Injected failure", "type": "server_error", "code": None}},
+                status_code=profile.error_status
+            )
+        app.state.counts["speech"] += 1
+        # About 1 KB of "audio" per character, derived from the input so repeats are identical
+        seed = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).digest()
+        chunks = max(1, len(body.get("input", "")) // 4)
+
+        async def audio():
+            for _ in range(chunks):
+                if token_interval > 0:
+                    await asyncio.sleep(token_interval)
+                yield seed * 128
+
+        return StreamingResponse(audio(), media_type="audio/mpeg")
+
+    return app
+
+
+def _conditions(location, day_offset=0):
+    """Stable, plausible weather for a location so repeated runs see the same data"""
+    seed = int(hashlib.sha1(f"{location}|{day_offset}".encode("utf-8")).hexdigest()[:8], 16)
+    temp = (seed % 400) / 10 - 5
+    return {
+        "datetime": time.strftime("%Y-%m-%d", time.gmtime(time.time() + day_offset * 86400)),
+        "temp": temp,
+        "tempmax": temp + 4,
+        "tempmin": temp - 4,
+        "feelslike": temp - 1,
+        "humidity": seed % 100,
+        "windspeed": (seed >> 8) % 40,
+        "winddir": (seed >> 4) % 360,
+        "precip": ((seed >> 12) % 50) / 10,
+        "precipprob": (seed >> 16) % 100,
+        "conditions": ["Clear", "Partially cloudy", "Overcast", "Rain"][seed % 4],
+        "description": "Generated by the load-test weather stand-in.",
+        "icon": ["clear-day", "partly-cloudy-day", "cloudy", "rain"][seed % 4],
+    }
+
+
+def create_weather_app(profile):
+    """The parts of the Visual Crossing timeline API that weather_service.py calls"""
+    app = _stats_app("Fake Visual Crossing")
+
+    @app.get("/{location}/{period}")
+    async def timeline(location: str, period: str, include: str = "days"):
+        await profile.delay()
+        if profile.should_fail():
+            app.state.counts["errors"] += 1
+            return JSONResponse({"message": "Injected failure"}, status_code=profile.error_status)
+
+        app.state.counts[include] += 1
+        if period.startswith("next") and period.endswith("days"):
+            days = [_conditions(location, offset) for offset in range(int(period[4:-4] or 1))]
+        else:
+            days = [_conditions(location)]
+        data = {
+            "resolvedAddress": location,
+            "address": location,
+            "timezone": "UTC",
+            "days": days,
+        }
+        if include == "current":
+            data["currentConditions"] = dict(days[0], datetime=time.strftime("%H:%M:%S", time.gmtime()))
+        return data
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake upstream server for load tests")
+    parser.add_argument("kind", choices=["openai", "weather"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--latency", default="fixed:0", help="latency distribution, e.g. lognormal:0.8,0.4")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--reply-words", type=int, default=60, help="length of fake chat replies")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="seconds between streamed tokens")
+    args = parser.parse_args(argv)
+
+    try:
+        profile = FaultProfile(args.latency, args.error_rate, args.error_status)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.kind == "openai":
+        app = create_openai_app(profile, args.reply_words, args.token_interval)
+    else:
+        app = create_weather_app(profile)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""Replay captured /chat traffic with its original timing.
+
+    python -m loadtest.replay traffic.jsonl --speed 1x
+    python -m loadtest.replay chat_history_42.ndjson --speed 10x --max-gap 30
+    python -m loadtest.replay history.tsv --speed max --concurrency 64 --target http://127.0.0.1:8000
+
+Input is one record per line, in either of these formats:
+
+- JSON lines with the message in ``message`` (or ``body``, ``title``,
+  ``text`` or ``prompt``, so a backlog file like requests.jsonl works) and
+  optionally ``timestamp``/``ts``/``time``/``created_at``, ``user_id``,
+  ``session_id`` and ``mode``. The NDJSON written by
+  /users/{id}/history/export has this shape but no ``user_id``; its
+  records are sent as ``--user-id``, or as the user in a
+  ``chat_history_<id>.ndjson`` file name.
+- chat_history rows as tab- or comma-separated values with a header line,
+  for example from ``mysql --batch -e "SELECT user_id, message, timestamp
+  FROM chat_history WHERE ..." > history.tsv``.
+
+At ``--speed 1x`` or ``10x`` each request is sent when it is due,
+whether or not earlier ones have finished (an open loop), so the backend
+sees the recorded load shape. Idle stretches longer than ``--max-gap``
+seconds are shortened. ``--speed max`` ignores the timing and keeps
+``--concurrency`` requests in flight. Records without a timestamp are
+spaced ``--interval`` seconds apart.
+
+Latency and errors are grouped by the route the backend actually took.
+The schedule lag (how late requests went out) shows whether the replay
+kept up; if it grows, raise ``--concurrency``.
+"""
+import os
+import re
+import csv
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import httpx
+
+from loadtest.run import classify, write_results
+from loadtest.stack import LocalStack, add_stack_arguments
+from loadtest.stats import LatencyRecorder, format_report, percentile
+
+MESSAGE_FIELDS = ("message", "body", "title", "text", "prompt")
+TIME_FIELDS = ("timestamp", "ts", "time", "created_at")
+PASSED_FIELDS = ("user_id", "session_id", "mode")
+# The file name /users/{id}/history/export gives its download
+EXPORT_NAME = re.compile(r"chat_history_(\d+)\.ndjson$")
+
+# ``at`` is seconds after the first request at 1x speed; ``payload`` is the /chat body
+Captured = namedtuple("Captured", "at payload")
+
+
+def parse_time(value):
+    """Seconds since the epoch for an ISO 8601 string or an epoch number (seconds or milliseconds)"""
+    if value in (None, "", "NULL"):
+        return None
+    if isinstance(value, (int, float)) or str(value).replace(".", "", 1).isdigit():
+        number = float(value)
+        return number / 1000 if number > 1e11 else number
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _record(fields):
+    """(timestamp or None, payload) for one captured record, or None if it has no message"""
+    message = next((fields[key] for key in MESSAGE_FIELDS if fields.get(key)), None)
+    if not isinstance(message, str) or not message.strip():
+        return None
+    payload = {"message": message}
+    for key in PASSED_FIELDS:
+        if fields.get(key) not in (None, "", "NULL"):
+            payload[key] = str(fields[key])
+    timestamp = next((parse_time(fields[key]) for key in TIME_FIELDS if fields.get(key) not in (None, "")), None)
+    return timestamp, payload
+
+
+def read_records(path):
+    with open(path, encoding="utf-8", newline="") as source:
+        first_line = source.readline()
+        source.seek(0)
+        if first_line.lstrip().startswith("{"):
+            for number, line in enumerate(source, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    print(f"Skipping line {number}: not valid JSON")
+        else:
+            delimiter = "\t" if "\t" in first_line else ","
+            quoting = csv.QUOTE_NONE if delimiter == "\t" else csv.QUOTE_MINIMAL
+            for row in csv.DictReader(source, delimiter=delimiter, quoting=quoting):
+                # mysql --batch writes newlines and tabs inside values as \n and \t
+                if delimiter == "\t":
+                    row = {key: value.replace("\\n", "\n").replace("\\t", "\t") if value else value
+                           for key, value in row.items()}
+                yield row
+
+
+def export_user_id(path):
+    """The user a chat_history_<id>.ndjson export belongs to, or None"""
+    match = EXPORT_NAME.search(os.path.basename(path))
+    return match.group(1) if match else None
+
+
+def load_traffic(path, interval=1.0, max_gap=None, limit=None, user_id=None):
+    """The captured requests in order, with their offsets from the first one
+
+    Records without a ``user_id`` are sent as ``user_id`` (a history export
+    has none of its own).
+    """
+    records = []
+    for fields in read_records(path):
+        record = _record(fields) if isinstance(fields, dict) else None
+        if record:
+            if user_id is not None:
+                record[1].setdefault("user_id", str(user_id))
+            records.append(record)
+            if limit and len(records) >= limit:
+                break
+    if records and all(timestamp is not None for timestamp, _ in records):
+        # Exports are not always oldest first (e.g. ORDER BY timestamp DESC)
+        records.sort(key=lambda record: record[0])
+
+    traffic = []
+    offset = 0.0
+    previous = None
+    for timestamp, payload in records:
+        if traffic:
+            gap = timestamp - previous if timestamp is not None and previous is not None else interval
+            gap = max(gap, 0.0)
+            if max_gap is not None:
+                gap = min(gap, max_gap)
+            offset += gap
+        traffic.append(Captured(offset, payload))
+        previous = timestamp
+    return traffic
+
+
+def observed_route(body):
+    """The route app.py took, judging by the extra data it attaches to the reply"""
+    if "weather_data" in body:
+        return "weather"
+    if "quantum_data" in body or "quantum_systems" in body:
+        return "quantum"
+    return "standard"
+
+
+def parse_speed(value):
+    """``1x``, ``10``, ``2.5x`` -> a multiplier; ``max`` -> None"""
+    value = value.strip().lower()
+    if value == "max":
+        return None
+    try:
+        speed = float(value.rstrip("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid speed {value!r}; use e.g. 1x, 10x or max")
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("Speed must be positive")
+    return speed
+
+
+async def replay(base_url, traffic, speed, concurrency, timeout=60):
+    """Send the captured requests; returns the recorder, the elapsed seconds and the schedule lags"""
+    recorder = LatencyRecorder()
+    lags = []
+    slots = asyncio.Semaphore(concurrency)
+    pending = set()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+
+        async def send(payload):
+            sent = time.perf_counter()
+            route = "unknown"
+            try:
+                response = await client.post("/chat", json=payload)
+                if response.status_code == 200:
+                    try:
+                        route = observed_route(response.json()["response"])
+                    except (ValueError, KeyError, TypeError):
+                        pass
+                error = classify(route, response)
+            except httpx.TimeoutException:
+                error = "timeout"
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            finally:
+                slots.release()
+            recorder.record(route, time.perf_counter() - sent, error)
+
+        started = time.perf_counter()
+        for captured in traffic:
+            if speed is not None:
+                due = started + captured.at / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await slots.acquire()
+            if speed is not None:
+                lags.append(time.perf_counter() - due)
+            task = asyncio.ensure_future(send(captured.payload))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+        elapsed = time.perf_counter() - started
+    return recorder, elapsed, lags
+
+
+def format_lag(lags):
+    values = sorted(lags)
+    if not values:
+        return "Schedule lag: n/a (--speed max)"
+    return (f"Schedule lag: p50 {percentile(values, 0.5) * 1000:.1f} ms, "
+            f"p99 {percentile(values, 0.99) * 1000:.1f} ms, max {values[-1] * 1000:.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay captured /chat traffic")
+    parser.add_argument("capture", help="JSONL request log, chat_history NDJSON export, or TSV/CSV rows")
+    parser.add_argument("--speed", type=parse_speed, default=parse_speed("1x"), help="1x, 10x, ... or max")
+    parser.add_argument("--concurrency", type=int, default=256,
+                        help="most requests in flight (at 'max' speed, exactly this many)")
+    parser.add_argument("--interval", type=float, default=1.0, help="spacing of records without a timestamp")
+    parser.add_argument("--max-gap", type=float, help="shorten idle stretches to this many seconds")
+    parser.add_argument("--limit", type=int, help="replay only the first N records")
+    parser.add_argument("--users", type=int, default=100, help="users to create in a scratch database")
+    parser.add_argument("--user-id", type=int,
+                        help="user for records without one (default: the id in a chat_history_<id>.ndjson name)")
+    parser.add_argument("--timeout", type=float, default=60, help="client timeout per request")
+    parser.add_argument("--json", help="write the results to this file")
+    add_stack_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.capture):
+        parser.error(f"{args.capture} does not exist")
+    user_id = args.user_id if args.user_id is not None else export_user_id(args.capture)
+    traffic = load_traffic(args.capture, args.interval, args.max_gap, args.limit, user_id)
+    if not traffic:
+        print("No replayable records found")
+        return 1
+    span = traffic[-1].at / args.speed if args.speed else None
+    print(f"Replaying {len(traffic)} requests" + (f" over about {span:.0f}s" if span is not None else " at full speed"))
+
+    # Captured user ids must exist in a scratch database to be used as they are
+    user_ids = [int(c.payload["user_id"]) for c in traffic if c.payload.get("user_id", "").isdigit()]
+    users = max([args.users] + user_ids)
+    try:
+        with LocalStack(args, users) as stack:
+            recorder, elapsed, lags = asyncio.run(
+                replay(stack.base_url, traffic, args.speed, args.concurrency, args.timeout)
+            )
+            upstreams = stack.upstream_counts()
+    except RuntimeError as e:
+        print(e)
+        return 1
+
+    summary = recorder.summary(elapsed)
+    print(format_report(summary, elapsed))
+    print(format_lag(lags))
+    for name, counts in upstreams.items():
+        print(f"Upstream {name}: {counts}")
+    if args.json:
+        write_results(args.json, args, summary, elapsed, upstreams)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""Boot the backend against fake upstreams and measure /chat under load.
+
+    python -m loadtest.run --concurrency 32 --duration 60
+    python -m loadtest.run --mix weather=1,quantum=1,standard=2 --openai-latency lognormal:1.5,0.5 \\
+        --openai-error-rate 0.02 --json before.json
+    python -m loadtest.run --baseline before.json --max-regression 0.2    # exits 1 on a regression
+
+Fake OpenAI and Visual Crossing servers, weather_api.py and app.py are
+started as local processes on free ports. They are configured only
+through environment variables, so no request reaches a real upstream.
+Process output and the backend logs are kept in a scratch directory.
+
+With ``--db setup`` (the default) a scratch database is built on a local
+MySQL server: ``--mysql-database`` is dropped and recreated from
+catchat_full_schema.sql, the migrations are applied and ``--users`` users
+are added. Never point it at a database holding real data. With
+``--db existing`` the database is used as it is. ``--target URL`` skips
+booting entirely and drives a backend that is already running.
+
+Each of ``--concurrency`` workers sends one /chat request at a time, so
+the offered load adapts to the backend's latency (a closed loop).
+Requests sent during ``--warmup`` are not counted.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import httpx
+
+from loadtest.stats import LatencyRecorder, format_report, compare_to_baseline
+from loadtest.stack import BACKEND_DIR, LocalStack, add_stack_arguments
+
+GAZETTEER_PATH = os.path.join(BACKEND_DIR, "gazetteer_places.tsv")
+
+WEATHER_TEMPLATES = [
+    "What's the weather in {place}?",
+    "Will it rain in {place} today?",
+    "What is the temperature in {place} right now?",
+    "Is it sunny in {place}?",
+]
+QUANTUM_TEMPLATES = [
+    "Help me decide between {a} and {b}",
+    "Let's play rock paper scissors",
+    "Generate Powerball lottery numbers",
+    "Pick Mega Millions lottery numbers for me",
+    "Generate a bitcoin nonce for mining",
+    "Show me the available quantum systems",
+]
+STANDARD_TEMPLATES = [
+    "Explain {topic} in simple terms",
+    "What are the pros and cons of {topic}?",
+    "Give me three facts about {topic}",
+    "How would you teach {topic} to a beginner?",
+]
+# None of these may contain a weather keyword ("rain" hides in "training")
+TOPICS = [
+    "recursion", "compound interest", "photosynthesis", "the French revolution", "public key cryptography",
+    "black holes", "sourdough baking", "the stock market", "jazz improvisation", "plate tectonics",
+    "vaccines", "electric cars", "the printing press", "game theory", "coral reefs", "binary search",
+]
+CHOICES = ["tea", "coffee", "pizza", "tacos", "the beach", "the mountains", "a bike", "a scooter"]
+
+ROUTES = ("weather", "quantum", "standard")
+
+
+def load_places(path=GAZETTEER_PATH):
+    """The first alias of every gazetteer entry, which the backend resolves to that place"""
+    places = []
+    with open(path, encoding="utf-8") as source:
+        for line in source:
+            line = line.strip()
+            if not line or line.startswith("#") or "\t" not in line:
+                continue
+            places.append(line.split("\t", 1)[1].split("|")[0].title())
+    return places
+
+
+def build_message(route, rng, places):
+    if route == "weather":
+        return rng.choice(WEATHER_TEMPLATES).format(place=rng.choice(places))
+    if route == "quantum":
+        a, b = rng.sample(CHOICES, 2)
+        return rng.choice(QUANTUM_TEMPLATES).format(a=a, b=b)
+    return rng.choice(STANDARD_TEMPLATES).format(topic=rng.choice(TOPICS))
+
+
+def parse_mix(value):
+    """``"weather=1,quantum=1,standard=2"`` -> {"weather": 1.0, ...}"""
+    mix = {}
+    for item in value.split(","):
+        route, _, weight = item.partition("=")
+        route = route.strip()
+        if route not in ROUTES:
+            raise argparse.ArgumentTypeError(f"Unknown route {route!r}; expected one of {', '.join(ROUTES)}")
+        try:
+            mix[route] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid weight for {route}: {weight!r}")
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("At least one route needs a positive weight")
+    return mix
+
+
+def classify(route, response):
+    """None for a good answer, otherwise a short error label"""
+    if response.status_code != 200:
+        return str(response.status_code)
+    try:
+        body = response.json()["response"]
+    except (ValueError, KeyError, TypeError):
+        return "invalid_json"
+    # The canned replies app.py sends when the LLM call failed
+    if body.get("summary") == "Response Unavailable" or str(body.get("details", "")).startswith("I encountered an issue"):
+        return "fallback"
+    # A weather or quantum message answered by another route means a lookup failed
+    if route == "weather" and "weather_data" not in body:
+        return "misrouted"
+    if route == "quantum" and "quantum_data" not in body and "quantum_systems" not in body:
+        return "misrouted"
+    return None
+
+
+async def drive(base_url, mix, concurrency, duration, warmup=0, max_requests=None, users=1, seed=None,
+                timeout=60, places=None):
+    """Send /chat requests from ``concurrency`` workers; returns the recorder and the measured seconds"""
+    rng = random.Random(seed)
+    places = places or load_places()
+    routes = list(mix)
+    weights = [mix[route] for route in routes]
+    recorder = LatencyRecorder()
+    issued = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        measure_from = time.perf_counter() + warmup
+        deadline = measure_from + duration
+
+        async def worker():
+            nonlocal issued
+            while time.perf_counter() < deadline and (max_requests is None or issued < max_requests):
+                issued += 1
+                route = rng.choices(routes, weights)[0]
+                payload = {"message": build_message(route, rng, places), "user_id": str(rng.randint(1, users))}
+                sent = time.perf_counter()
+                try:
+                    response = await client.post("/chat", json=payload)
+                    error = classify(route, response)
+                except httpx.TimeoutException:
+                    error = "timeout"
+                except httpx.HTTPError as e:
+                    error = type(e).__name__
+                if sent >= measure_from:
+                    recorder.record(route, time.perf_counter() - sent, error)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - measure_from
+    return recorder, max(elapsed, 0.0)
+
+
+def write_results(path, args, summary, elapsed, upstreams):
+    config = {key: value for key, value in vars(args).items() if key != "mysql_password"}
+    with open(path, "w", encoding="utf-8") as out:
+        json.dump({"config": config, "elapsed": elapsed, "routes": summary, "upstreams": upstreams},
+                  out, indent=2, default=str)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test /chat against local fake upstreams")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of unmeasured traffic first")
+    parser.add_argument("--requests", type=int, help="stop after this many requests")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("weather=1,quantum=1,standard=2"),
+                        help="relative weight of each route (default weather=1,quantum=1,standard=2)")
+    parser.add_argument("--users", type=int, default=100, help="distinct user ids to send")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--timeout", type=float, default=60, help="client timeout per request")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed relative p95/throughput change against --baseline")
+    add_stack_arguments(parser)
+    args = parser.parse_args(argv)
+
+    run = dict(mix=args.mix, concurrency=args.concurrency, duration=args.duration, warmup=args.warmup,
+               max_requests=args.requests, users=args.users, seed=args.seed, timeout=args.timeout)
+    try:
+        with LocalStack(args, args.users) as stack:
+            print(f"Running {args.concurrency} workers for {args.warmup:g}s warmup + {args.duration:g}s...")
+            recorder, elapsed = asyncio.run(drive(stack.base_url, **run))
+            upstreams = stack.upstream_counts()
+    except RuntimeError as e:
+        print(e)
+        return 1
+
+    summary = recorder.summary(elapsed)
+    print(format_report(summary, elapsed))
+    for name, counts in upstreams.items():
+        print(f"Upstream {name}: {counts}")
+
+    if args.json:
+        write_results(args.json, args, summary, elapsed, upstreams)
+    if args.baseline:
+        regressions = compare_to_baseline(summary, args.baseline, args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""Booting the backend and its fake upstreams as local processes.
+
+Everything is configured through environment variables only: the
+backend talks to the fake OpenAI and Visual Crossing servers and to the
+MySQL database given on the command line, never to a real upstream.
+"""
+import os
+import sys
+import time
+import socket
+import tempfile
+import subprocess
+
+import httpx
+import mysql.connector
+from mysql.connector import Error
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_PATH = os.path.join(os.path.dirname(BACKEND_DIR), "catchat_full_schema.sql")
+
+
+def split_sql(script):
+    """Split a SQL dump into statements, ignoring ``--`` comments and semicolons inside quotes.
+
+    ``/*!...*/`` blocks are kept: MySQL runs them, and the dump relies on
+    them to turn off foreign key checks while tables are created.
+    """
+    statements = []
+    current = []
+    quote = None
+    i = 0
+    while i < len(script):
+        char = script[i]
+        if quote:
+            current.append(char)
+            if char == "\\" and quote != "`" and i + 1 < len(script):
+                current.append(script[i + 1])
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in "'\"`":
+            quote = char
+            current.append(char)
+        elif script.startswith("--", i) and (i + 2 == len(script) or script[i + 2] in " \t\r\n"):
+            newline = script.find("\n", i)
+            i = len(script) if newline == -1 else newline
+            continue
+        elif char == ";":
+            statement = "".join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+        else:
+            current.append(char)
+        i += 1
+    statement = "".join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def setup_database(host, port, user, password, database, users):
+    """Recreate ``database`` from the schema dump and migrations, with ``users`` users"""
+    from migrate import Migrator
+
+    conn = mysql.connector.connect(host=host, port=port, user=user, password=password)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+        cursor.execute(f"CREATE DATABASE `{database}`")
+        cursor.execute(f"USE `{database}`")
+        with open(SCHEMA_PATH, encoding="utf-8") as source:
+            for statement in split_sql(source.read()):
+                cursor.execute(statement)
+                if cursor.with_rows:
+                    cursor.fetchall()
+        conn.commit()
+        cursor.close()
+        Migrator(conn, echo=lambda line: None).up()
+
+        cursor = conn.cursor()
+        rows = [(user_id, f"loadtest{user_id}", f"loadtest{user_id}@example.com") for user_id in range(1, users + 1)]
+        cursor.executemany("INSERT INTO users (id, username, email) VALUES (%s, %s, %s)", rows)
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Service:
+    """A child process that is ready once ``health_url`` answers"""
+
+    def __init__(self, name, command, env, health_url, log_dir):
+        self.name = name
+        self.command = command
+        self.env = env
+        self.health_url = health_url
+        self.log_path = os.path.join(log_dir, f"{name}.out")
+        self.process = None
+        self._log = None
+
+    def start(self, timeout=60):
+        self._log = open(self.log_path, "ab")
+        self.process = subprocess.Popen(
+            self.command, cwd=BACKEND_DIR, env=self.env, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.name} exited with code {self.process.returncode}; see {self.log_path}")
+            try:
+                httpx.get(self.health_url, timeout=1)
+                return
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        raise RuntimeError(f"{self.name} did not become ready within {timeout}s; see {self.log_path}")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._log:
+            self._log.close()
+
+
+def upstream_counts(url):
+    try:
+        return httpx.get(url, timeout=2).json()
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+def build_services(args, work_dir):
+    openai_port, weather_port, weather_api_port, app_port = (free_port() for _ in range(4))
+    python = sys.executable
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "sk-loadtest",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "VISUAL_CROSSING_API_KEY": "loadtest",
+        "VISUAL_CROSSING_BASE_URL": f"http://127.0.0.1:{weather_port}",
+        "WEATHER_API_URL": f"http://127.0.0.1:{weather_api_port}",
+        "MYSQL_HOST": args.mysql_host,
+        "MYSQL_PORT": str(args.mysql_port),
+        "MYSQL_USER": args.mysql_user,
+        "MYSQL_PASSWORD": args.mysql_password,
+        "MYSQL_DATABASE": args.mysql_database,
+        "CHAT_HISTORY_SPILL_PATH": os.path.join(work_dir, "chat_history_spill.jsonl"),
+        # Memory-only response cache, so one run does not warm the next
+        "LLM_CACHE_DIR": "",
+    })
+    if args.disable_caches:
+        env.update({
+            "LLM_CACHE_QUANTUM_SYSTEMS_TTL": "0",
+            "LLM_CACHE_STANDARD_TTL": "0",
+            "NEAR_DUP_ENABLED": "false",
+        })
+
+    def uvicorn(module, port, workers=1):
+        return [python, "-m", "uvicorn", module, "--host", "127.0.0.1", "--port", str(port),
+                "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+
+    def fake(kind, port, latency, error_rate):
+        return [python, "-m", "loadtest.fake_upstreams", kind, "--port", str(port),
+                "--latency", latency, "--error-rate", str(error_rate)]
+
+    openai_url = f"http://127.0.0.1:{openai_port}"
+    weather_url = f"http://127.0.0.1:{weather_port}"
+    services = [
+        Service("fake_openai", fake("openai", openai_port, args.openai_latency, args.openai_error_rate),
+                env, f"{openai_url}/_stats", work_dir),
+        Service("fake_weather", fake("weather", weather_port, args.weather_latency, args.weather_error_rate),
+                env, f"{weather_url}/_stats", work_dir),
+        Service("weather_api", uvicorn("weather_api:app", weather_api_port),
+                dict(env, LOG_FILE=os.path.join(work_dir, "weather.log")),
+                f"http://127.0.0.1:{weather_api_port}/", work_dir),
+        Service("backend", uvicorn("app:app", app_port, args.app_workers),
+                dict(env, LOG_FILE=os.path.join(work_dir, "backend.log")),
+                f"http://127.0.0.1:{app_port}/", work_dir),
+    ]
+    upstreams = {"openai": f"{openai_url}/_stats", "visual_crossing": f"{weather_url}/_stats"}
+    return services, f"http://127.0.0.1:{app_port}", upstreams
+
+
+
+def add_stack_arguments(parser):
+    """Command-line options shared by every tool that boots the local stack"""
+    group = parser.add_argument_group("local stack")
+    group.add_argument("--target", help="drive this running backend instead of booting one")
+    group.add_argument("--app-workers", type=int, default=1, help="uvicorn workers for app.py")
+    group.add_argument("--disable-caches", action="store_true",
+                       help="turn off the LLM response cache and near-duplicate answers")
+    group.add_argument("--openai-latency", default="lognormal:0.8,0.4")
+    group.add_argument("--openai-error-rate", type=float, default=0.0)
+    group.add_argument("--weather-latency", default="lognormal:0.15,0.3")
+    group.add_argument("--weather-error-rate", type=float, default=0.0)
+    group.add_argument("--db", choices=["setup", "existing"], default="setup")
+    group.add_argument("--mysql-host", default=os.getenv("LOADTEST_MYSQL_HOST", "127.0.0.1"))
+    group.add_argument("--mysql-port", type=int, default=int(os.getenv("LOADTEST_MYSQL_PORT", "3306")))
+    group.add_argument("--mysql-user", default=os.getenv("LOADTEST_MYSQL_USER", "root"))
+    group.add_argument("--mysql-password", default=os.getenv("LOADTEST_MYSQL_PASSWORD", ""))
+    group.add_argument("--mysql-database", default="catchat_loadtest")
+
+
+class LocalStack:
+    """The backend under test: booted locally, or just ``--target`` when one is given"""
+
+    def __init__(self, args, users):
+        self.args = args
+        self.users = users
+        self.base_url = args.target
+        self.work_dir = None
+        self._services = []
+        self._upstream_urls = {}
+
+    def start(self):
+        if self.args.target:
+            return
+        args = self.args
+        self.work_dir = tempfile.mkdtemp(prefix="catchat-loadtest-")
+        print(f"Logs and process output: {self.work_dir}")
+        if args.db == "setup":
+            print(f"Building scratch database {args.mysql_database} on {args.mysql_host}:{args.mysql_port}...")
+            try:
+                setup_database(args.mysql_host, args.mysql_port, args.mysql_user, args.mysql_password,
+                               args.mysql_database, self.users)
+            except Error as e:
+                raise RuntimeError(f"Could not set up the database: {e}")
+        self._services, self.base_url, self._upstream_urls = build_services(args, self.work_dir)
+        for service in self._services:
+            service.start()
+        print(f"Backend ready on {self.base_url}")
+
+    def upstream_counts(self):
+        """What each fake upstream answered so far, by kind"""
+        return {name: upstream_counts(url) for name, url in self._upstream_urls.items()}
+
+    def stop(self):
+        for service in reversed(self._services):
+            service.stop()
+        self._services = []
+
+    def __enter__(self):
+        try:
+            self.start()
+        except BaseException:
+            self.stop()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,106 @@
+"""Per-route latency and error bookkeeping for load runs"""
+import json
+import math
+from collections import Counter
+
+
+def percentile(sorted_values, quantile):
+    """Linear-interpolated quantile of an already sorted list"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * quantile
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return sorted_values[lower]
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class LatencyRecorder:
+    """Collects one sample per request, grouped by route"""
+
+    QUANTILES = (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+
+    def __init__(self):
+        self._latencies = {}
+        self._errors = {}
+
+    def record(self, route, seconds, error=None):
+        """``error`` is None for a success, otherwise a short label such as "500" or "timeout" """
+        self._latencies.setdefault(route, []).append(seconds)
+        errors = self._errors.setdefault(route, Counter())
+        if error is not None:
+            errors[error] += 1
+
+    def _summarize(self, latencies, errors, elapsed):
+        values = sorted(latencies)
+        summary = {
+            "requests": len(values),
+            "errors": sum(errors.values()),
+            "rps": len(values) / elapsed if elapsed else 0.0,
+            "mean_ms": sum(values) / len(values) * 1000 if values else None,
+            "max_ms": values[-1] * 1000 if values else None,
+        }
+        for name, quantile in self.QUANTILES:
+            value = percentile(values, quantile)
+            summary[f"{name}_ms"] = value * 1000 if value is not None else None
+        summary["error_kinds"] = dict(errors)
+        return summary
+
+    def summary(self, elapsed):
+        """Per-route statistics plus an "all" entry covering every request"""
+        routes = {
+            route: self._summarize(latencies, self._errors[route], elapsed)
+            for route, latencies in sorted(self._latencies.items())
+        }
+        all_errors = Counter()
+        for errors in self._errors.values():
+            all_errors.update(errors)
+        all_latencies = [value for latencies in self._latencies.values() for value in latencies]
+        routes["all"] = self._summarize(all_latencies, all_errors, elapsed)
+        return routes
+
+
+def _ms(value):
+    return f"{value:9.1f}" if value is not None else f"{'-':>9}"
+
+
+def format_report(summary, elapsed):
+    lines = [
+        f"Duration {elapsed:.1f}s",
+        f"{'route':<12}{'requests':>9}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}",
+    ]
+    for route, stats in summary.items():
+        lines.append(
+            f"{route:<12}{stats['requests']:>9}{stats['errors']:>8}{stats['rps']:>9.1f}"
+            f"{_ms(stats['p50_ms'])}{_ms(stats['p95_ms'])}{_ms(stats['p99_ms'])}{_ms(stats['max_ms'])}"
+        )
+    for route, stats in summary.items():
+        if route != "all" and stats["error_kinds"]:
+            kinds = ", ".join(f"{kind} x{count}" for kind, count in sorted(stats["error_kinds"].items()))
+            lines.append(f"  {route} errors: {kinds}")
+    return "\n".join(lines)
+
+
+# Absolute increase in error rate that counts as a regression
+ERROR_RATE_SLACK = 0.01
+
+
+def compare_to_baseline(summary, baseline_path, max_regression):
+    """Lines describing routes whose p95 or throughput got worse than the baseline by more than ``max_regression``"""
+    with open(baseline_path, encoding="utf-8") as source:
+        baseline = json.load(source)["routes"]
+    regressions = []
+    for route, stats in summary.items():
+        before = baseline.get(route)
+        if not before or not stats["requests"]:
+            continue
+        if before.get("p95_ms") and stats["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{route}: p95 {before['p95_ms']:.1f} ms -> {stats['p95_ms']:.1f} ms")
+        if before.get("rps") and stats["rps"] < before["rps"] * (1 - max_regression):
+            regressions.append(f"{route}: throughput {before['rps']:.1f} -> {stats['rps']:.1f} rps")
+        before_rate = before["errors"] / before["requests"] if before.get("requests") else 0
+        rate = stats["errors"] / stats["requests"]
+        if rate > before_rate + ERROR_RATE_SLACK:
+            regressions.append(f"{route}: error rate {before_rate:.1%} -> {rate:.1%}")
+    return regressions
@@ -0,0 +1,177 @@
+"""Queue-based logging that keeps formatting and disk I/O off the request path.
+
+``setup_logging`` routes the root logger into a bounded in-memory queue.
+A background ``QueueListener`` thread formats each record as one JSON
+object per line and writes it to a size-rotated file. On the calling
+side a log call only builds the LogRecord: ``msg % args`` and the JSON
+encoding run in the writer thread, so use lazy arguments
+(``logger.debug("Fetched %s", location)``) rather than f-strings.
+
+High-volume loggers can be sampled: ``LOG_SAMPLE_RATES="weather_service=0.1"``
+keeps one DEBUG record in ten from ``weather_service`` (and its child
+loggers). INFO and above are never sampled. When the queue is full,
+records are dropped and counted instead of blocking the caller.
+"""
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, including any ``extra`` fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of DEBUG records from the configured loggers.
+
+    Sampling is deterministic (every Nth record per logger), which is
+    cheaper than drawing a random number and keeps bursts representative.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        # Longest prefix first, so "catchat.weather" overrides "catchat"
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _rate(self, name):
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0:
+            return True
+        if rate <= 0:
+            return False
+        every = round(1 / rate)
+        with self._lock:
+            seen = self._counters.get(record.name, 0)
+            self._counters[record.name] = seen + 1
+        return seen % every == 0
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener and drops records when full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The stock prepare() formats the message here, on the caller's thread.
+        # Records are handed over as they are; the listener formats them.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sample_rates(value):
+    """Parse ``"name=0.1,other=0.5"`` into a dict"""
+    rates = {}
+    for item in (value or "").split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            try:
+                rates[name.strip()] = float(rate)
+            except ValueError:
+                continue
+    return rates
+
+
+def setup_logging(path, level="INFO", max_bytes=50 * 1024 * 1024, backup_count=5, sample_rates=None,
+                  queue_size=10000):
+    """Send every logger through the background JSON writer. Safe to call more than once."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        file_handler.setFormatter(JSONFormatter())
+
+        log_queue = queue.Queue(maxsize=queue_size)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        if sample_rates:
+            queue_handler.addFilter(SamplingFilter(sample_rates))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+        # httpx logs every request URL at INFO, and Visual Crossing takes its API key in the query string
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+
+        _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        _listener.queue_handler = queue_handler
+        _listener.start()
+        # Flush what is still queued when the process exits
+        atexit.register(stop_logging)
+        return _listener
+
+
+def setup_logging_from_env(default_path):
+    """``setup_logging`` configured by LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT and LOG_SAMPLE_RATES"""
+    return setup_logging(
+        os.getenv("LOG_FILE", default_path),
+        level=os.getenv("LOG_LEVEL", "INFO"),
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024))),
+        backup_count=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+        sample_rates=parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+    )
+
+
+def stop_logging():
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+
+
+def dropped_records():
+    return _listener.queue_handler.dropped if _listener is not None else 0
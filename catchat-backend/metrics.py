@@ -0,0 +1,274 @@
+"""In-process latency histograms and counters with Prometheus text output.
+
+Instrument a stage with ``timed``, which works around both sync and
+async code because it only measures wall time between entering and
+leaving the block:
+
+    with timed("openai_call"):
+        response = await client.chat.completions.create(...)
+
+Every stage feeds the ``catchat_stage_seconds`` histogram and, when the
+block raises, ``catchat_stage_errors_total``. ``REGISTRY.render()``
+produces the text exposition format served on /metrics, and
+``MetricsRecorder`` periodically writes per-stage percentiles to
+bot_performance_metrics.
+"""
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from mysql.connector import Error
+
+logger = logging.getLogger("catchat")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [per-bucket counts (not cumulative), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels + ("le",), label_values + (_format_value(float(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge:
+    """A value read from ``callback`` at render time: a number, or a dict of label value -> number"""
+
+    def __init__(self, name, help_text, callback, label=None):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.label = label
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.error(f"Error reading gauge {self.name}: {e}")
+            return lines
+        if isinstance(value, dict):
+            for label_value, number in sorted(value.items()):
+                lines.append(f"{self.name}{_format_labels((self.label,), (label_value,))} {_format_value(number)}")
+        else:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "catchat_stage_seconds", "Latency of each processing stage", labels=("stage",)
+))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "catchat_stage_errors_total", "Stages that ended with an exception", labels=("stage",)
+))
+
+
+@contextmanager
+def timed(stage):
+    """Record how long the block takes under ``stage``, and count it as an error if it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        # Cancellation and generator close are not failures of the stage
+        STAGE_ERRORS.inc(stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage)
+
+
+def histogram_quantile(quantile, buckets, counts):
+    """Estimate a quantile from per-bucket counts by interpolating inside the bucket"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = quantile * total
+    cumulative = 0
+    lower = 0.0
+    for bound, count in zip(buckets, counts):
+        if count and cumulative + count >= rank:
+            if bound == math.inf:
+                return lower
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        if bound != math.inf:
+            lower = bound
+    return lower
+
+
+class MetricsRecorder:
+    """Periodically write per-stage latency summaries to bot_performance_metrics.
+
+    Every ``interval`` seconds the stage histogram is diffed against the
+    previous snapshot, and for each stage that saw traffic the count,
+    error count, mean and p50/p95/p99 of that interval are inserted in
+    one multi-row INSERT as ``stage.<name>.<statistic>`` metrics.
+    """
+
+    QUANTILES = (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+
+    def __init__(self, pool, interval=60, histogram=STAGE_SECONDS, errors=STAGE_ERRORS):
+        self.pool = pool
+        self.interval = interval
+        self.histogram = histogram
+        self.errors = errors
+        self._previous = histogram.snapshot()
+        self._previous_errors = errors.snapshot()
+        self._stop = threading.Event()
+        self._thread = None
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def summarize(self):
+        """Rows of (metric_name, value) for the interval since the last call"""
+        current = self.histogram.snapshot()
+        current_errors = self.errors.snapshot()
+        rows = []
+        for labels, (counts, total, count) in sorted(current.items()):
+            previous_counts, previous_total, previous_count = self._previous.get(
+                labels, ([0] * len(counts), 0.0, 0)
+            )
+            interval_count = count - previous_count
+            if interval_count <= 0:
+                continue
+            interval_counts = [now - before for now, before in zip(counts, previous_counts)]
+            prefix = "stage." + ".".join(labels)
+            rows.append((prefix + ".count", interval_count))
+            rows.append((prefix + ".errors", current_errors.get(labels, 0) - self._previous_errors.get(labels, 0)))
+            rows.append((prefix + ".mean", (total - previous_total) / interval_count))
+            for name, quantile in self.QUANTILES:
+                rows.append((f"{prefix}.{name}", histogram_quantile(quantile, self.histogram.buckets, interval_counts)))
+        self._previous = current
+        self._previous_errors = current_errors
+        return rows
+
+    def flush(self):
+        rows = self.summarize()
+        if not rows:
+            return
+        query = (
+            "INSERT INTO bot_performance_metrics (metric_name, metric_value) VALUES "
+            + ", ".join(["(%s, %s)"] * len(rows))
+        )
+        params = [value for row in rows for value in row]
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(query, params)
+                    conn.commit()
+                finally:
+                    cursor.close()
+            self.flushes += 1
+        except Error as e:
+            # Losing one interval of summaries is fine; /metrics still has the totals
+            self.failed_flushes += 1
+            logger.error(f"Could not write {len(rows)} performance metrics: {e}")
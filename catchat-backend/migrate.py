@@ -0,0 +1,225 @@
+"""Versioned schema migrations.
+
+    python migrate.py status              list applied and pending migrations
+    python migrate.py up [--to N]         apply pending migrations in order
+    python migrate.py up --dry-run        print the statements without running them
+    python migrate.py partitions          add upcoming monthly partitions (run monthly, e.g. from cron)
+
+Applied versions are recorded in the ``schema_migrations`` table together
+with a checksum of the migration file, so an edited migration is reported.
+Connection settings come from the same MYSQL_* variables as the backend.
+"""
+import os
+import re
+import sys
+import glob
+import hashlib
+import argparse
+import importlib.util
+
+import mysql.connector
+from mysql.connector import Error
+from dotenv import load_dotenv
+
+from migrations import ensure_future_partitions
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.py$")
+LOCK_NAME = "catchat_schema_migrations"
+# Tables that are range-partitioned by month
+PARTITIONED_TABLES = ["chat_history"]
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+        with open(path, "rb") as source:
+            self.checksum = hashlib.sha256(source.read()).hexdigest()
+
+    def load(self):
+        spec = importlib.util.spec_from_file_location(f"migrations.m{self.version:04d}", self.path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+
+def discover_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+        match = MIGRATION_FILE.match(os.path.basename(path))
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), path))
+    versions = [migration.version for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Two migration files share a version number")
+    return migrations
+
+
+class Database:
+    """What a migration sees: ``execute`` for changes and ``query`` for reads"""
+
+    def __init__(self, conn, dry_run=False, echo=print):
+        self.conn = conn
+        self.dry_run = dry_run
+        self.echo = echo
+
+    def execute(self, statement, params=None):
+        self.echo(("-- dry run: " if self.dry_run else "") + statement.strip() + ";")
+        if self.dry_run:
+            return
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(statement, params)
+            self.conn.commit()
+        finally:
+            cursor.close()
+
+    def query(self, statement, params=None):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(statement, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+
+class Migrator:
+    def __init__(self, conn, migrations=None, echo=print):
+        self.conn = conn
+        self.migrations = migrations if migrations is not None else discover_migrations()
+        self.echo = echo
+
+    def _ensure_table(self):
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+              `version` int NOT NULL,
+              `name` varchar(255) NOT NULL,
+              `checksum` char(64) NOT NULL,
+              `applied_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+              PRIMARY KEY (`version`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
+        """)
+        cursor.close()
+
+    def applied(self):
+        self._ensure_table()
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT version, checksum FROM schema_migrations")
+        applied = dict(cursor.fetchall())
+        cursor.close()
+        return applied
+
+    def pending(self, target=None):
+        applied = self.applied()
+        return [
+            migration for migration in self.migrations
+            if migration.version not in applied and (target is None or migration.version <= target)
+        ]
+
+    def status(self):
+        applied = self.applied()
+        for migration in self.migrations:
+            checksum = applied.get(migration.version)
+            if checksum is None:
+                state = "pending"
+            elif checksum != migration.checksum:
+                state = "applied (file changed since)"
+            else:
+                state = "applied"
+            self.echo(f"{migration.version:04d} {migration.name}: {state}")
+
+    def _lock(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, 30)", (LOCK_NAME,))
+        acquired = cursor.fetchone()[0]
+        cursor.close()
+        if acquired != 1:
+            raise RuntimeError("Another migration run holds the lock")
+
+    def _unlock(self):
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+        cursor.fetchall()
+        cursor.close()
+
+    def up(self, target=None, dry_run=False):
+        """Apply pending migrations in version order; returns how many ran"""
+        self._lock()
+        try:
+            pending = self.pending(target)
+            if not pending:
+                self.echo("Schema is up to date")
+            db = Database(self.conn, dry_run=dry_run, echo=self.echo)
+            for migration in pending:
+                module = migration.load()
+                self.echo(f"Applying {migration.version:04d} {migration.name}: {module.DESCRIPTION}")
+                module.upgrade(db)
+                if not dry_run:
+                    cursor = self.conn.cursor()
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                        (migration.version, migration.name, migration.checksum)
+                    )
+                    self.conn.commit()
+                    cursor.close()
+            return len(pending)
+        finally:
+            self._unlock()
+
+    def add_partitions(self, months_ahead=3, dry_run=False):
+        db = Database(self.conn, dry_run=dry_run, echo=self.echo)
+        for table in PARTITIONED_TABLES:
+            added = ensure_future_partitions(db, table, months_ahead)
+            self.echo(f"{table}: {added} partitions added")
+
+
+def connect(database=None):
+    load_dotenv()
+    return mysql.connector.connect(
+        host=os.getenv("MYSQL_HOST"),
+        port=int(os.getenv("MYSQL_PORT", "3306")),
+        user=os.getenv("MYSQL_USER"),
+        password=os.getenv("MYSQL_PASSWORD"),
+        database=database or os.getenv("MYSQL_DATABASE")
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Catchat schema migrations")
+    parser.add_argument("--database", help="database to migrate (default: MYSQL_DATABASE)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status")
+    up = commands.add_parser("up")
+    up.add_argument("--to", type=int, help="stop after this version")
+    up.add_argument("--dry-run", action="store_true")
+    partitions = commands.add_parser("partitions")
+    partitions.add_argument("--months-ahead", type=int, default=3)
+    partitions.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    try:
+        conn = connect(args.database)
+    except Error as e:
+        print(f"Could not connect to MySQL: {e}")
+        return 1
+    try:
+        migrator = Migrator(conn)
+        if args.command == "status":
+            migrator.status()
+        elif args.command == "up":
+            migrator.up(args.to, dry_run=args.dry_run)
+        else:
+            migrator.add_partitions(args.months_ahead, dry_run=args.dry_run)
+    except Error as e:
+        print(f"Migration failed: {e}")
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Time-ordered access paths for chat_history, sessions and quantum_intent_mapping.
+
+chat_history becomes RANGE-partitioned by month on ``timestamp`` with a
+``(user_id, timestamp)`` index, so per-user history reads are index
+range scans and time-bounded analytics only touch the months they ask
+for. MySQL does not allow foreign keys on partitioned tables, and every
+unique key must contain the partitioning column, so the foreign key to
+users is dropped (the backend already validates user ids before writing)
+and the primary key becomes ``(id, timestamp)``.
+"""
+from datetime import date
+
+from migrations import (
+    add_months,
+    foreign_key_exists,
+    index_exists,
+    monthly_partitions,
+    partition_names,
+    primary_key_columns,
+)
+
+DESCRIPTION = "Partition chat_history by month and add composite/covering indexes"
+
+# Months of empty partitions created ahead of today
+MONTHS_AHEAD = 3
+
+
+def upgrade_chat_history(db):
+    # The partitioning column must be NOT NULL for rows to land in a month
+    db.execute("UPDATE chat_history SET `timestamp` = CURRENT_TIMESTAMP WHERE `timestamp` IS NULL")
+
+    if foreign_key_exists(db, "chat_history", "chat_history_ibfk_1"):
+        db.execute("ALTER TABLE chat_history DROP FOREIGN KEY chat_history_ibfk_1")
+
+    changes = []
+    if primary_key_columns(db, "chat_history") != ["id", "timestamp"]:
+        changes += [
+            "MODIFY `timestamp` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP",
+            "DROP PRIMARY KEY",
+            "ADD PRIMARY KEY (`id`, `timestamp`)",
+        ]
+    if not index_exists(db, "chat_history", "idx_user_timestamp"):
+        changes.append("ADD KEY `idx_user_timestamp` (`user_id`, `timestamp`)")
+    if index_exists(db, "chat_history", "user_id"):
+        # Superseded by the composite index, which has user_id as its prefix
+        changes.append("DROP KEY `user_id`")
+    if changes:
+        db.execute("ALTER TABLE chat_history " + ", ".join(changes))
+
+    if not partition_names(db, "chat_history"):
+        oldest = db.query("SELECT MIN(`timestamp`) FROM chat_history")[0][0]
+        first_month = (oldest.date() if oldest else date.today()).replace(day=1)
+        partitions = monthly_partitions(first_month, add_months(date.today(), MONTHS_AHEAD))
+        partitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        db.execute(
+            "ALTER TABLE chat_history PARTITION BY RANGE (UNIX_TIMESTAMP(`timestamp`)) ("
+            + ", ".join(partitions) + ")"
+        )
+
+
+def upgrade_quantum_intent_mapping(db):
+    if not index_exists(db, "quantum_intent_mapping", "idx_application_confidence"):
+        # Covers per-application pattern counts and threshold filters without touching rows
+        db.execute(
+            "ALTER TABLE quantum_intent_mapping "
+            "ADD KEY `idx_application_confidence` (`quantum_application_id`, `confidence_threshold`)"
+        )
+    if not index_exists(db, "quantum_intent_mapping", "idx_intent_pattern"):
+        # Duplicate checks in the intent seeding scripts look patterns up by text
+        db.execute("ALTER TABLE quantum_intent_mapping ADD KEY `idx_intent_pattern` (`intent_pattern`(255))")
+    if index_exists(db, "quantum_intent_mapping", "quantum_application_id"):
+        # The foreign key is served by idx_application_confidence from here on
+        db.execute("ALTER TABLE quantum_intent_mapping DROP KEY `quantum_application_id`")
+
+
+def upgrade_sessions(db):
+    if not index_exists(db, "sessions", "idx_user_session"):
+        # Covers "latest sessions of a user" including whether they ended
+        db.execute("ALTER TABLE sessions ADD KEY `idx_user_session` (`user_id`, `session_start`, `session_end`)")
+    if index_exists(db, "sessions", "user_id"):
+        db.execute("ALTER TABLE sessions DROP KEY `user_id`")
+
+
+def upgrade(db):
+    upgrade_chat_history(db)
+    upgrade_quantum_intent_mapping(db)
+    upgrade_sessions(db)
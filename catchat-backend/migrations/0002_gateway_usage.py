@@ -0,0 +1,28 @@
+"""Daily per-user usage of the OpenAI-compatible /v1/chat/completions gateway.
+
+One row per day, user and model. The backend adds to the counters in
+place (``INSERT ... ON DUPLICATE KEY UPDATE``) every time it flushes, so
+rows stay small and a month of usage for one user is an index range
+scan on ``idx_user_day``.
+"""
+
+DESCRIPTION = "Add gateway_usage for per-user token and latency accounting"
+
+
+def upgrade(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS gateway_usage (
+            `day` date NOT NULL,
+            `user_name` varchar(64) NOT NULL,
+            `model` varchar(64) NOT NULL,
+            `requests` int unsigned NOT NULL DEFAULT 0,
+            `cached_requests` int unsigned NOT NULL DEFAULT 0,
+            `failed_requests` int unsigned NOT NULL DEFAULT 0,
+            `estimated_requests` int unsigned NOT NULL DEFAULT 0,
+            `prompt_tokens` bigint unsigned NOT NULL DEFAULT 0,
+            `completion_tokens` bigint unsigned NOT NULL DEFAULT 0,
+            `latency_seconds` double NOT NULL DEFAULT 0,
+            PRIMARY KEY (`day`, `user_name`, `model`),
+            KEY `idx_user_day` (`user_name`, `day`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
@@ -0,0 +1,24 @@
+"""Drop idx_application_confidence from quantum_intent_mapping.
+
+Migration 0001 adds ``(quantum_application_id, confidence_threshold)``
+and drops the plain foreign key index in its favour, but no query uses
+it: IntentEngine reads the whole mapping once and matches in memory.
+0001 has shipped and is left as it is (migrate.py checksums applied
+files), so this migration undoes that part of it, on fresh databases
+and migrated ones alike. The foreign key still needs an index on
+``quantum_application_id``, so that one is put back before the
+composite goes.
+"""
+from migrations import index_exists
+
+DESCRIPTION = "Drop the unused idx_application_confidence index"
+
+
+def upgrade(db):
+    if not index_exists(db, "quantum_intent_mapping", "idx_application_confidence"):
+        return
+    changes = []
+    if not index_exists(db, "quantum_intent_mapping", "quantum_application_id"):
+        changes.append("ADD KEY `quantum_application_id` (`quantum_application_id`)")
+    changes.append("DROP KEY `idx_application_confidence`")
+    db.execute("ALTER TABLE quantum_intent_mapping " + ", ".join(changes))
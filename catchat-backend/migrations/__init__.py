@@ -0,0 +1,99 @@
+"""Schema migrations for the Catchat database.
+
+Each migration is a file named ``NNNN_description.py`` in this directory
+that defines ``DESCRIPTION`` and ``upgrade(db)``. MySQL commits DDL
+implicitly, so a migration cannot be rolled back as a whole; write every
+step so that re-running it after a partial failure is safe, using the
+helpers below to check what is already in place.
+
+Run them with ``python migrate.py``.
+"""
+import re
+from datetime import date
+
+_MONTH_PARTITION = re.compile(r"^p(\d{4})(\d{2})$")
+
+
+def index_exists(db, table, index):
+    rows = db.query(
+        "SELECT 1 FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s LIMIT 1",
+        (table, index)
+    )
+    return bool(rows)
+
+
+def foreign_key_exists(db, table, name):
+    rows = db.query(
+        "SELECT 1 FROM information_schema.TABLE_CONSTRAINTS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND CONSTRAINT_NAME = %s "
+        "AND CONSTRAINT_TYPE = 'FOREIGN KEY'",
+        (table, name)
+    )
+    return bool(rows)
+
+
+def primary_key_columns(db, table):
+    rows = db.query(
+        "SELECT COLUMN_NAME FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = 'PRIMARY' "
+        "ORDER BY SEQ_IN_INDEX",
+        (table,)
+    )
+    return [row[0] for row in rows]
+
+
+def partition_names(db, table):
+    rows = db.query(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION",
+        (table,)
+    )
+    return [row[0] for row in rows]
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def month_partition(month_start):
+    """Partition clause holding the rows of the month starting at ``month_start``"""
+    upper = add_months(month_start, 1)
+    return (
+        f"PARTITION p{month_start:%Y%m} VALUES LESS THAN "
+        f"(UNIX_TIMESTAMP('{upper:%Y-%m-%d} 00:00:00'))"
+    )
+
+
+def monthly_partitions(first_month, last_month):
+    """Partition clauses for every month from ``first_month`` to ``last_month`` inclusive"""
+    clauses = []
+    month = date(first_month.year, first_month.month, 1)
+    while month <= last_month:
+        clauses.append(month_partition(month))
+        month = add_months(month, 1)
+    return clauses
+
+
+def ensure_future_partitions(db, table, months_ahead=3, today=None):
+    """Split the catch-all ``pmax`` partition so months up to ``months_ahead`` have their own.
+
+    Returns the number of partitions added. Run it regularly (it is part
+    of ``python migrate.py partitions``) so new rows never pile up in pmax.
+    """
+    months = [_MONTH_PARTITION.match(name) for name in partition_names(db, table)]
+    months = [match for match in months if match]
+    if not months:
+        return 0
+    next_month = add_months(date(int(months[-1].group(1)), int(months[-1].group(2)), 1), 1)
+    target = add_months(today or date.today(), months_ahead)
+    clauses = monthly_partitions(next_month, target)
+    if not clauses:
+        return 0
+    db.execute(
+        f"ALTER TABLE `{table}` REORGANIZE PARTITION pmax INTO ("
+        + ", ".join(clauses + ["PARTITION pmax VALUES LESS THAN MAXVALUE"]) + ")"
+    )
+    return len(clauses)
@@ -0,0 +1,173 @@
+"""Near-duplicate lookup of past questions with MinHash and LSH.
+
+Each question is normalized (lowercase, punctuation dropped, whitespace
+collapsed), stripped of stop words ("what", "which", "do", "you", ...)
+so the wording around the subject does not decide the match, capped at
+``max_chars`` and cut into overlapping character shingles. A MinHash
+signature of ``num_perm`` values estimates the Jaccard similarity of two
+shingle sets, and the signature is split into ``bands`` buckets so only
+questions sharing at least one bucket are compared (LSH banding).
+
+This catches rewordings, typos and reordered phrases of the same
+question. It does not understand synonyms: questions that share few
+characters will not match however close their meaning is.
+"""
+import re
+import random
+import zlib
+import threading
+from collections import OrderedDict
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_APOSTROPHES = re.compile(r"['\u2019]")
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+# Question words, pronouns, auxiliaries and fillers. Negations are kept on purpose:
+# "is it safe" and "is it not safe" must not look alike.
+STOP_WORDS = frozenset("""
+    a an the what which who whom whose how do does did you your i me my we us our is are am was were be
+    been can could would should will have has had there any of to for on in about please tell it this
+    that some give list show
+""".split())
+
+
+def normalize_question(text):
+    return " ".join(_NON_WORD.sub(" ", _APOSTROPHES.sub("", text.lower())).split())
+
+
+def content_words(question):
+    """A normalized question without its stop words; the question itself if nothing else is left"""
+    words = [word for word in question.split() if word not in STOP_WORDS]
+    return " ".join(words) if words else question
+
+
+class NearDuplicateIndex:
+    """Thread-safe MinHash/LSH index of question -> stored answer.
+
+    Entries are grouped by ``scope`` (for example the chat route) and a
+    lookup only ever returns an answer from the same scope. Questions of
+    fewer than ``min_words`` words ("yes", "tell me more") mean nothing
+    without the conversation around them, so they are neither indexed
+    nor looked up. Once ``max_entries`` questions are indexed the oldest
+    are dropped. Only the first ``max_chars`` characters of a question's
+    content words are hashed, which bounds the cost of a signature.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle_size=4, max_entries=50000, seed=1,
+                 min_words=4, max_chars=200):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_entries = max_entries
+        self.min_words = min_words
+        self.max_chars = max_chars
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+        self._lock = threading.Lock()
+        # (scope, normalized question) -> (signature, answer), oldest first
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self.lookups = 0
+        self.hits = 0
+        self.candidates_checked = 0
+
+    def _shingles(self, question):
+        if len(question) <= self.shingle_size:
+            return {question}
+        return {question[i:i + self.shingle_size] for i in range(len(question) - self.shingle_size + 1)}
+
+    def signature(self, question):
+        """MinHash signature of a normalized question"""
+        content = content_words(question)[:self.max_chars]
+        hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in self._shingles(content)]
+        return tuple(
+            min((a * h + b) % _PRIME for h in hashes) & _MAX_HASH
+            for a, b in self._perms
+        )
+
+    def _indexable(self, question):
+        return len(question.split()) >= self.min_words
+
+    def _band_keys(self, scope, signature):
+        rows = self.rows
+        return [(scope, band, signature[band * rows:(band + 1) * rows]) for band in range(self.bands)]
+
+    def add(self, scope, question, answer):
+        """Index an answered question; a repeat of a known question updates its answer"""
+        question = normalize_question(question)
+        if not answer or not self._indexable(question):
+            return
+        key = (scope, question)
+        signature = self.signature(question)
+        with self._lock:
+            if key in self._entries:
+                self._entries[key] = (signature, answer)
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = (signature, answer)
+            for band_key in self._band_keys(scope, signature):
+                self._buckets.setdefault(band_key, []).append(key)
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        key, (signature, _) = self._entries.popitem(last=False)
+        for band_key in self._band_keys(key[0], signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is None:
+                continue
+            try:
+                bucket.remove(key)
+            except ValueError:
+                pass
+            if not bucket:
+                del self._buckets[band_key]
+
+    def lookup(self, scope, question):
+        """Return ``(answer, similarity)`` for the closest indexed question, or None"""
+        question = normalize_question(question)
+        if not self._indexable(question):
+            return None
+        signature = self.signature(question)
+        best = None
+        with self._lock:
+            self.lookups += 1
+            exact = self._entries.get((scope, question))
+            if exact is not None:
+                self.hits += 1
+                return exact[1], 1.0
+            seen = set()
+            for band_key in self._band_keys(scope, signature):
+                for key in self._buckets.get(band_key, ()):
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    other, answer = self._entries[key]
+                    similarity = sum(x == y for x, y in zip(signature, other)) / self.num_perm
+                    if similarity >= self.threshold and (best is None or similarity > best[1]):
+                        best = (answer, similarity)
+            self.candidates_checked += len(seen)
+            if best is not None:
+                self.hits += 1
+        return best
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "buckets": len(self._buckets),
+                "threshold": self.threshold,
+                "min_words": self.min_words,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "candidates_checked": self.candidates_checked,
+            }
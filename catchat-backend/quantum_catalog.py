@@ -0,0 +1,156 @@
+import json
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger("catchat")
+
+
+def _plain(value):
+    """JSON-safe form of a catalog column (DECIMAL, dates and JSON columns become strings)"""
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    return str(value)
+
+
+class CatalogSnapshot:
+    """One version of quantum_systems_catalog with everything derived from it computed once.
+
+    ``data`` is the catalog as returned by /test-quantum-systems, ``json``
+    the same serialized, ``systems_text`` the block of system lines used
+    in prompts and ``digest`` a hash of it. A snapshot is never changed
+    after it is built; a catalog edit produces a new one, so readers can
+    share it without copying or locking.
+    """
+
+    __slots__ = ("version", "source", "loaded_at", "data", "json", "systems_text", "digest")
+
+    def __init__(self, rows, version=None, source="database"):
+        systems = [{key: _plain(value) for key, value in row.items()} for row in rows]
+        data = {
+            "systems": systems,
+            "total_count": len(systems),
+            "free_systems_count": sum(1 for system in systems if system["is_free"]),
+            "paid_systems_count": sum(1 for system in systems if not system["is_free"]),
+        }
+        lines = []
+        for system in systems:
+            line = f"- {system['name']} ({system['qubits']} qubits, {system['type']}, {'Free' if system['is_free'] else 'Paid'})"
+            if system["description"]:
+                line += f": {system['description']}"
+            lines.append(line)
+        systems_text = "\n".join(lines)
+
+        for name, value in (
+            ("version", version),
+            ("source", source),
+            ("loaded_at", time.time()),
+            ("data", data),
+            ("json", json.dumps(data, ensure_ascii=False)),
+            ("systems_text", systems_text),
+            ("digest", hashlib.sha1(systems_text.encode("utf-8")).hexdigest()),
+        ):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CatalogSnapshot is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError("CatalogSnapshot is read-only")
+
+
+class QuantumCatalog:
+    """The current CatalogSnapshot, replaced when quantum_systems_catalog changes.
+
+    ``load_version`` should be cheap (a row count and the latest
+    ``updated_at``); the catalog is only read again when it reports a
+    change. A new snapshot is swapped in with a single assignment, so
+    ``current()`` never waits on a reload. While the table cannot be
+    read, the snapshot built from ``fallback_rows`` is served and loading
+    is retried on every poll.
+    """
+
+    def __init__(self, load_rows, load_version, fallback_rows, refresh_interval=30):
+        self._load_rows = load_rows
+        self._load_version = load_version
+        self._fallback_rows = fallback_rows
+        self.refresh_interval = refresh_interval
+        self._snapshot = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.reloads = 0
+        self.failed_reloads = 0
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    def current(self):
+        """The snapshot in use; loads the catalog on first use"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.reload()
+            snapshot = self._snapshot
+        return snapshot
+
+    def reload(self):
+        """Read the catalog and swap in a new snapshot; returns False if the fallback is in use"""
+        # Only one reload at a time; readers keep using the old snapshot meanwhile
+        with self._reload_lock:
+            version = self._load_version()
+            rows = self._load_rows() if version is not None else None
+            if rows is None:
+                self.failed_reloads += 1
+                if self._snapshot is None:
+                    self._snapshot = CatalogSnapshot(self._fallback_rows, source="fallback")
+                    logger.warning("Using fallback data for quantum systems (%d systems)", len(self._fallback_rows))
+                else:
+                    logger.debug("Quantum systems catalog could not be read; keeping the %s snapshot",
+                                 self._snapshot.source)
+                return False
+            self._snapshot = CatalogSnapshot(rows, version)
+            self.reloads += 1
+        logger.info("Loaded %d quantum systems (catalog version %s)", len(rows), version)
+        return True
+
+    def refresh_if_changed(self):
+        """Reload the catalog if it changed, or is not loaded yet, since the last load"""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.source != "fallback":
+            version = self._load_version()
+            if version is None or version == snapshot.version:
+                return False
+            logger.info("quantum_systems_catalog changed, reloading")
+        return self.reload()
+
+    def start_auto_reload(self):
+        """Poll for catalog changes in a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="quantum-catalog-reload", daemon=True)
+        self._thread.start()
+
+    def stop_auto_reload(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh_if_changed()
+            except Exception as e:
+                logger.error("Error refreshing quantum systems catalog: %s", e)
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "loaded": snapshot is not None,
+            "source": snapshot.source if snapshot else None,
+            "version": str(snapshot.version) if snapshot and snapshot.version is not None else None,
+            "systems": snapshot.data["total_count"] if snapshot else 0,
+            "age_seconds": time.time() - snapshot.loaded_at if snapshot else None,
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+        }
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger("catchat")
+
+
+def normalize_messages(messages):
+    """Collapse whitespace in message content so cosmetic differences share a key"""
+    return [
+        {"role": message["role"], "content": " ".join(str(message.get("content") or "").split())}
+        for message in messages
+    ]
+
+
+# Sampling parameters that only some requests set; they join the key when present
+OPTIONAL_PARAMETERS = ("top_p", "stop", "presence_penalty", "frequency_penalty", "seed")
+
+
+def completion_key(completion):
+    """Hash the parts of a chat completion request that decide the answer"""
+    payload = {
+        "model": completion.get("model"),
+        "messages": normalize_messages(completion.get("messages", [])),
+        "temperature": completion.get("temperature"),
+        "max_tokens": completion.get("max_tokens"),
+    }
+    for name in OPTIONAL_PARAMETERS:
+        if completion.get(name) is not None:
+            payload[name] = completion[name]
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier cache of LLM replies keyed by ``completion_key``.
+
+    Replies live in an in-memory LRU and, when ``disk_path`` is set, in
+    one small JSON file per key so they survive restarts and are shared
+    between workers. Both tiers honour the entry's TTL; the disk tier is
+    trimmed oldest-first once it grows past ``disk_max_bytes``.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, disk_path=None, disk_max_bytes=64 * 1024 * 1024):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
+        self._disk_lock = threading.Lock()
+        self._disk_files = OrderedDict()  # key -> size, oldest first
+        self._disk_bytes = 0
+        self.disk_hits = 0
+        self.disk_evictions = 0
+        if disk_path:
+            os.makedirs(disk_path, exist_ok=True)
+            self._scan_disk()
+
+    def _scan_disk(self):
+        entries = []
+        for name in os.listdir(self.disk_path):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.disk_path, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_files[key] = size
+            self._disk_bytes += size
+        logger.info(f"LLM response cache has {len(self._disk_files)} entries on disk in {self.disk_path}")
+
+    def _disk_file(self, key):
+        return os.path.join(self.disk_path, key + ".json")
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_file(key), encoding="utf-8") as entry_file:
+                entry = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+        expires_at = entry.get("expires_at")
+        if expires_at is not None and expires_at <= time.time():
+            self._remove_disk(key)
+            return None
+        return entry
+
+    def _write_disk(self, key, value, ttl):
+        entry = {"expires_at": None if ttl is None else time.time() + ttl, "value": value}
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        tmp_path = self._disk_file(key) + f".{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as entry_file:
+                entry_file.write(data)
+            os.replace(tmp_path, self._disk_file(key))
+        except OSError as e:
+            logger.error(f"Could not write LLM response cache entry {key}: {e}")
+            return
+        with self._disk_lock:
+            self._disk_bytes += len(data) - self._disk_files.pop(key, 0)
+            self._disk_files[key] = len(data)
+            while self._disk_bytes > self.disk_max_bytes and len(self._disk_files) > 1:
+                oldest = next(iter(self._disk_files))
+                self._remove_disk_locked(oldest)
+                self.disk_evictions += 1
+
+    def _remove_disk(self, key):
+        with self._disk_lock:
+            self._remove_disk_locked(key)
+
+    def _remove_disk_locked(self, key):
+        self._disk_bytes -= self._disk_files.pop(key, 0)
+        try:
+            os.remove(self._disk_file(key))
+        except OSError:
+            pass
+
+    def get(self, key):
+        """Return the cached reply for ``key``, or None"""
+        value = self.memory.get(key)
+        if value is not None or not self.disk_path:
+            return value
+        entry = self._read_disk(key)
+        if entry is None:
+            return None
+        self.disk_hits += 1
+        # Promote to memory for the rest of its lifetime
+        expires_at = entry.get("expires_at")
+        ttl = None if expires_at is None else max(expires_at - time.time(), 0)
+        self.memory.set(key, entry["value"], ttl=ttl)
+        return entry["value"]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.memory.set(key, value, ttl=ttl)
+        if self.disk_path:
+            self._write_disk(key, value, ttl)
+
+    def stats(self):
+        snapshot = self.memory.stats()
+        snapshot.update({
+            "disk_entries": len(self._disk_files),
+            "disk_bytes": self._disk_bytes,
+            "disk_hits": self.disk_hits,
+            "disk_evictions": self.disk_evictions,
+        })
+        return snapshot
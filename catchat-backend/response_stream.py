@@ -0,0 +1,93 @@
+import json
+
+SUMMARY_MARKER = "Summary:"
+DETAILS_MARKER = "Details:"
+
+# Text seen before any "Summary:" marker is held back this long before we
+# decide the reply is unstructured and stream it as details
+UNSTRUCTURED_AFTER = 64
+
+
+def sse_event(event, data):
+    """Encode one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _partial_marker_length(text, marker):
+    """Length of the longest suffix of text that is a proper prefix of marker"""
+    for size in range(min(len(marker) - 1, len(text)), 0, -1):
+        if marker.startswith(text[-size:]):
+            return size
+    return 0
+
+
+class SectionStreamParser:
+    """Split a streamed "Summary: ... Details: ..." reply as it arrives.
+
+    Mirrors ``format_response`` incrementally: ``feed`` takes raw tokens
+    and returns ``(section, text)`` pieces for "summary" or "details",
+    holding back only as much text as could still turn out to be part of
+    a marker. Replies without a summary marker stream as details.
+    """
+
+    def __init__(self):
+        self.section = None  # None until we know which section we are in
+        self.buffer = ""
+        self._leading = True
+
+    def _emit(self, text):
+        if not text:
+            return []
+        if self._leading:
+            # format_response strips the start of each section
+            text = text.lstrip()
+            if not text:
+                return []
+            self._leading = False
+        return [(self.section, text)]
+
+    def _switch(self, section):
+        self.section = section
+        self._leading = True
+
+    def feed(self, token):
+        self.buffer += token
+        pieces = []
+
+        if self.section is None:
+            index = self.buffer.find(SUMMARY_MARKER)
+            if index >= 0:
+                # Anything before the marker is dropped, as in format_response
+                self.buffer = self.buffer[index + len(SUMMARY_MARKER):]
+                self._switch("summary")
+            elif len(self.buffer) > UNSTRUCTURED_AFTER:
+                self._switch("details")
+            else:
+                return pieces
+
+        if self.section == "summary":
+            index = self.buffer.find(DETAILS_MARKER)
+            if index >= 0:
+                pieces += self._emit(self.buffer[:index].rstrip())
+                self.buffer = self.buffer[index + len(DETAILS_MARKER):]
+                self._switch("details")
+            else:
+                keep = _partial_marker_length(self.buffer, DETAILS_MARKER)
+                ready = self.buffer[:len(self.buffer) - keep]
+                self.buffer = self.buffer[len(ready):]
+                if ready:
+                    pieces += self._emit(ready)
+                return pieces
+
+        if self.buffer:
+            pieces += self._emit(self.buffer)
+            self.buffer = ""
+        return pieces
+
+    def close(self):
+        """Flush whatever is still held back at the end of the stream"""
+        if self.section is None:
+            self._switch("details")
+        pieces = self._emit(self.buffer.rstrip()) if self.buffer.strip() else []
+        self.buffer = ""
+        return pieces
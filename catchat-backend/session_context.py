@@ -0,0 +1,132 @@
+import logging
+import threading
+from collections import deque
+
+from ttl_cache import TTLCache
+
+logger = logging.getLogger("catchat")
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token for English text)"""
+    return len(text) // 4 + 1 if text else 0
+
+
+def _topic(message):
+    message = " ".join(message.split())
+    return message if len(message) <= 80 else message[:77] + "..."
+
+
+class ConversationSession:
+    """Recent turns of one conversation plus a short digest of older ones"""
+
+    def __init__(self, max_turns, max_topics):
+        self.turns = deque()
+        self.topics = deque(maxlen=max_topics)
+        self.max_turns = max_turns
+        self.lock = threading.Lock()
+
+    def append(self, message, reply):
+        with self.lock:
+            self.turns.append((message, reply))
+            while len(self.turns) > self.max_turns:
+                self.topics.append(_topic(self.turns.popleft()[0]))
+
+
+class SessionContextStore:
+    """Per-session conversation context kept within a token budget.
+
+    Sessions live in memory for ``idle_ttl`` seconds after their last
+    turn. A session this process has not seen yet is hydrated once from
+    ``load_turns(user_id, limit)``, which returns the user's most recent
+    ``(message, reply)`` pairs oldest first.
+
+    ``context`` returns chat messages for the prompt: the newest turns
+    that fit in ``token_budget``, preceded by one system message that
+    lists what the older turns were about. Turns beyond ``max_turns`` are
+    rolled up into that list as soon as they fall out of the window.
+    """
+
+    def __init__(self, load_turns=None, max_sessions=10000, idle_ttl=1800, max_turns=20,
+                 max_topics=10, token_budget=1500, max_turn_tokens=400):
+        self.load_turns = load_turns
+        self.sessions = TTLCache(maxsize=max_sessions, ttl=idle_ttl)
+        self.max_turns = max_turns
+        self.max_topics = max_topics
+        self.token_budget = token_budget
+        self.max_turn_tokens = max_turn_tokens
+        self.hydrated = 0
+        self.truncated_turns = 0
+
+    def _session(self, key, hydrate_user_id=None):
+        session = self.sessions.get(key)
+        if session is not None:
+            return session
+        session = ConversationSession(self.max_turns, self.max_topics)
+        if hydrate_user_id is not None and self.load_turns:
+            try:
+                for message, reply in self.load_turns(hydrate_user_id, self.max_turns):
+                    session.append(message, reply or "")
+                self.hydrated += 1
+            except Exception as e:
+                logger.error(f"Could not load chat history for session {key}: {e}")
+        self.sessions.set(key, session)
+        return session
+
+    def _clip(self, text, tokens):
+        if estimate_tokens(text) <= tokens:
+            return text
+        return text[:tokens * 4].rstrip() + " ..."
+
+    def _fit(self, turns, budget):
+        """Newest-first turns as chat messages within ``budget``; returns (messages, turns dropped)"""
+        kept = []
+        for position, (message, reply) in enumerate(reversed(turns)):
+            message = self._clip(message, self.max_turn_tokens)
+            reply = self._clip(reply, self.max_turn_tokens)
+            cost = estimate_tokens(message) + estimate_tokens(reply)
+            if cost > budget:
+                return kept, len(turns) - position
+            budget -= cost
+            if reply:
+                kept.append({"role": "assistant", "content": reply})
+            kept.append({"role": "user", "content": message})
+        return kept, 0
+
+    def context(self, key, hydrate_user_id=None):
+        """Chat messages carrying the conversation so far, within the token budget"""
+        session = self._session(key, hydrate_user_id)
+        with session.lock:
+            turns = list(session.turns)
+            topics = list(session.topics)
+
+        kept, dropped = self._fit(turns, self.token_budget)
+        if dropped or topics:
+            # Keep a quarter of the budget for the digest of older turns
+            digest_budget = self.token_budget // 4
+            kept, dropped = self._fit(turns, self.token_budget - digest_budget)
+            self.truncated_turns += dropped
+            topics = (topics + [_topic(message) for message, _ in turns[:dropped]])[-self.max_topics:]
+            while topics:
+                digest = "Earlier in this conversation the user asked about: " + "; ".join(topics)
+                if estimate_tokens(digest) <= digest_budget:
+                    kept.append({"role": "system", "content": digest})
+                    break
+                topics.pop(0)
+        kept.reverse()
+        return kept
+
+    def append(self, key, message, reply):
+        session = self._session(key)
+        session.append(message, reply)
+        # Re-set to restart the idle timer
+        self.sessions.set(key, session)
+
+    def stats(self):
+        snapshot = self.sessions.stats()
+        snapshot.update({
+            "hydrated": self.hydrated,
+            "truncated_turns": self.truncated_turns,
+            "token_budget": self.token_budget,
+        })
+        return snapshot
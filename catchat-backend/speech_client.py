@@ -0,0 +1,172 @@
+import time
+import asyncio
+import logging
+import httpx
+from openai import AsyncOpenAI
+
+from metrics import timed, STAGE_SECONDS, STAGE_ERRORS
+
+logger = logging.getLogger("catchat")
+
+
+class SpeechBusy(Exception):
+    """Too many callers are already waiting for a slot"""
+
+
+class SpeechError(Exception):
+    """The upstream refused a synthesis request before sending any audio"""
+
+    def __init__(self, status_code, detail):
+        super().__init__(f"Speech synthesis failed with HTTP {status_code}: {detail}")
+        self.status_code = status_code
+
+
+class ConcurrencyLimit:
+    """At most ``limit`` holders at a time; callers beyond ``max_waiting`` queued ones are refused"""
+
+    def __init__(self, limit, max_waiting):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self._semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def acquire(self):
+        """Wait for a slot; returns the seconds spent waiting"""
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise SpeechBusy()
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return time.perf_counter() - started
+
+    def release(self, ok):
+        self.in_flight -= 1
+        self._semaphore.release()
+        if ok:
+            self.completed += 1
+        else:
+            self.failed += 1
+
+    def stats(self):
+        return {
+            "max_in_flight": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+
+class SpeechClient:
+    """Async OpenAI audio client with its own concurrency caps.
+
+    Voice requests are slow and large, so they get slots of their own
+    instead of competing with chat completions in LLMClient: a burst of
+    uploads queues here while text chats keep flowing.
+    """
+
+    def __init__(self, api_key, max_transcriptions=4, max_syntheses=4, max_waiting=32, timeout=60):
+        self.client = AsyncOpenAI(api_key=api_key, timeout=timeout)
+        self.transcriptions = ConcurrencyLimit(max_transcriptions, max_waiting)
+        self.syntheses = ConcurrencyLimit(max_syntheses, max_waiting)
+        # Synthesis goes straight through httpx so audio can be relayed as it arrives;
+        # the base URL is the SDK's, so OPENAI_BASE_URL applies here as well
+        self.http = httpx.AsyncClient(
+            base_url=str(self.client.base_url),
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_syntheses, max_keepalive_connections=max_syntheses)
+        )
+
+    async def transcribe(self, file, filename, model="whisper-1"):
+        """Transcribe an audio file object; returns the text and the queue/transcribe seconds"""
+        queued = await self.transcriptions.acquire()
+        STAGE_SECONDS.observe(queued, "speech_to_text_queue")
+        started = time.perf_counter()
+        ok = False
+        try:
+            with timed("speech_to_text"):
+                # The file name tells Whisper the audio format
+                transcript = await self.client.audio.transcriptions.create(model=model, file=(filename, file))
+            ok = True
+        finally:
+            self.transcriptions.release(ok)
+        elapsed = time.perf_counter() - started
+        logger.debug("Transcription finished in %.2fs after %.2fs in the queue", elapsed, queued)
+        return transcript.text, {"queue": queued, "transcribe": elapsed}
+
+    async def synthesize(self, text, voice, model="tts-1", response_format="mp3"):
+        """Start synthesizing ``text``; returns a SpeechStream once the upstream has accepted.
+
+        Upstream refusals raise SpeechError here, before any audio has
+        been relayed, so the caller can still answer with an error status.
+        """
+        queued = await self.syntheses.acquire()
+        STAGE_SECONDS.observe(queued, "text_to_speech_queue")
+        started = time.perf_counter()
+        try:
+            request = self.http.build_request(
+                "POST", "audio/speech",
+                json={"model": model, "voice": voice, "input": text, "response_format": response_format}
+            )
+            response = await self.http.send(request, stream=True)
+        except BaseException:
+            self.syntheses.release(False)
+            raise
+        if response.status_code != 200:
+            detail = (await response.aread())[:200].decode("utf-8", "replace")
+            await response.aclose()
+            self.syntheses.release(False)
+            raise SpeechError(response.status_code, detail)
+        STAGE_SECONDS.observe(time.perf_counter() - started, "text_to_speech_first_byte")
+        return SpeechStream(self, response, started)
+
+    def stats(self):
+        return {"transcriptions": self.transcriptions.stats(), "syntheses": self.syntheses.stats()}
+
+    async def close(self):
+        await self.http.aclose()
+        await self.client.close()
+
+
+class SpeechStream:
+    """Audio chunks of one synthesis as the upstream sends them; holds a synthesis slot until closed"""
+
+    def __init__(self, speech, response, started):
+        self.speech = speech
+        self.response = response
+        self.started = started
+        self.size = 0
+        self._ok = False
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self.response.aiter_raw():
+            self.size += len(chunk)
+            yield chunk
+        self._ok = True
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        # Give the slot back first: when the listener hangs up this runs
+        # inside a cancelled task, and the await below may not complete
+        self.speech.syntheses.release(self._ok)
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(elapsed, "text_to_speech")
+        if not self._ok:
+            STAGE_ERRORS.inc("text_to_speech")
+        logger.debug("Relayed %d bytes of synthesized audio in %.2fs (ok=%s)", self.size, elapsed, self._ok)
+        await self.response.aclose()
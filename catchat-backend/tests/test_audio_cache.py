@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from audio_cache import AudioCache, RangeNotSatisfiable, audio_key, parse_byte_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=0-1,5-9", None),
+    ("items=0-1", None),
+    ("bytes=abc", None),
+    ("bytes=-", None),
+])
+def test_parse_byte_range(header, expected):
+    assert parse_byte_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=500-100", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_byte_range(header, 1000)
+
+
+def test_audio_key_depends_on_every_input():
+    key = audio_key("hello", "alloy", "tts-1")
+    assert key == audio_key("hello", "alloy", "tts-1", "mp3")
+    assert len({key, audio_key("hello!", "alloy", "tts-1"), audio_key("hello", "nova", "tts-1"),
+                audio_key("hello", "alloy", "tts-1-hd"), audio_key("hello", "alloy", "tts-1", "opus")}) == 5
+
+
+def store(cache, key, data):
+    writer = cache.writer(key)
+    for start in range(0, len(data), 10):
+        writer.write(data[start:start + 10])
+    writer.commit()
+
+
+def test_committed_clips_are_served(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=1000)
+    assert cache.get("a") is None
+    store(cache, "a", b"x" * 50)
+    path, size = cache.get("a")
+    assert size == 50 and open(path, "rb").read() == b"x" * 50
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_aborted_and_oversized_clips_are_not_cached(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=1000, max_entry_bytes=100)
+    writer = cache.writer("cut-off")
+    writer.write(b"x" * 10)
+    writer.abort()
+    writer.abort()
+    store(cache, "too-big", b"x" * 150)
+    assert cache.get("cut-off") is None and cache.get("too-big") is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_least_recently_served_clips_are_evicted(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=100, max_entry_bytes=50)
+    store(cache, "a", b"a" * 40)
+    store(cache, "b", b"b" * 40)
+    cache.get("a")
+    store(cache, "c", b"c" * 40)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_a_restart_keeps_clips_and_drops_partial_files(tmp_path):
+    cache = AudioCache(str(tmp_path), max_bytes=1000)
+    store(cache, "a", b"a" * 40)
+    cache.writer("b").write(b"b" * 10)  # never committed, as if the process died
+    reopened = AudioCache(str(tmp_path), max_bytes=1000)
+    assert reopened.get("a")[1] == 40
+    assert sorted(os.listdir(tmp_path)) == ["a.audio"]
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from audio_upload import UploadError, UploadTooLarge, receive_upload
+
+BOUNDARY = "catchat-boundary"
+
+
+class FakeRequest:
+    def __init__(self, body, chunk_size=7, content_type=f"multipart/form-data; boundary={BOUNDARY}"):
+        self.headers = {"content-type": content_type, "content-length": str(len(body))}
+        self._chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    async def stream(self):
+        for chunk in self._chunks:
+            yield chunk
+
+
+def multipart_body(audio, field="file", filename="clip.webm"):
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="note"\r\n\r\n'
+        f"hello\r\n"
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: audio/webm\r\n\r\n"
+    ).encode() + audio + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def receive(request, **kwargs):
+    return asyncio.run(receive_upload(request, **kwargs))
+
+
+@pytest.mark.parametrize("spool_bytes", [1024, 16])
+def test_the_file_part_is_spooled(spool_bytes):
+    audio = bytes(range(256)) * 4
+    upload = receive(FakeRequest(multipart_body(audio)), spool_bytes=spool_bytes)
+    try:
+        assert (upload.filename, upload.content_type, upload.size) == ("clip.webm", "audio/webm", len(audio))
+        assert upload.file.read() == audio
+    finally:
+        upload.close()
+
+
+def test_uploads_over_the_limit_are_refused():
+    with pytest.raises(UploadTooLarge):
+        receive(FakeRequest(multipart_body(b"x" * 2000)), max_bytes=1000)
+
+
+@pytest.mark.parametrize("request_, message", [
+    (FakeRequest(b"this is not multipart at all\r\n"), "Malformed"),
+    (FakeRequest(multipart_body(b"x" * 100)[:-50]), "middle of the file"),
+    (FakeRequest(multipart_body(b"abc", field="other")), "No 'file'"),
+    (FakeRequest(b"", content_type="application/json"), "multipart/form-data"),
+])
+def test_bad_bodies_are_upload_errors(request_, message):
+    with pytest.raises(UploadError, match=message):
+        receive(request_)
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from chat_gateway import (
+    CallerBusy, CallerLimits, UsageLedger, chunk_event, error_body, identify_caller, parse_api_keys,
+    unsupported_parameters,
+)
+
+
+@pytest.mark.parametrize("parameters, refused", [
+    ({"tools": [{"type": "function"}], "tool_choice": "required"}, ["tool_choice", "tools"]),
+    ({"functions": [{"name": "f"}], "function_call": {"name": "f"}}, ["function_call", "functions"]),
+    ({"n": 2}, ["n"]),
+    ({"response_format": {"type": "json_object"}}, ["response_format"]),
+    ({"logprobs": True, "top_logprobs": 3}, ["logprobs", "top_logprobs"]),
+])
+def test_parameters_that_change_the_reply_shape_are_refused(parameters, refused):
+    assert unsupported_parameters(parameters) == refused
+
+
+def test_harmless_and_default_parameters_are_let_through():
+    assert unsupported_parameters({
+        "stream_options": {"include_usage": True},
+        "max_completion_tokens": 100,
+        "logit_bias": {"50256": -100},
+        "n": 1,
+        "tools": [],
+        "tool_choice": "none",
+        "response_format": {"type": "text"},
+        "logprobs": False,
+    }) == []
+
+
+def test_parse_api_keys_names_unnamed_keys():
+    assert parse_api_keys(" sk-abcdef123:reports , sk-zyxwvu987 ,") == {
+        "sk-abcdef123": "reports",
+        "sk-zyxwvu987": "key-sk-zyx",
+    }
+
+
+@pytest.mark.parametrize("header, caller", [
+    ("Bearer sk-1", "reports"),
+    ("bearer  sk-2", "search"),
+    ("Bearer sk-3", None),
+    ("Basic sk-1", None),
+    ("Bearer", None),
+    (None, None),
+])
+def test_identify_caller(header, caller):
+    assert identify_caller(header, {"sk-1": "reports", "sk-2": "search"}) == caller
+
+
+def test_caller_limits_refuse_beyond_the_cap_per_caller():
+    limits = CallerLimits(max_in_flight=2)
+    limits.acquire("reports")
+    limits.acquire("reports")
+    limits.acquire("search")
+    with pytest.raises(CallerBusy):
+        limits.acquire("reports")
+    assert limits.in_flight("reports") == 2 and limits.in_flight() == 3
+
+    limits.release("reports")
+    limits.acquire("reports")
+    for _ in range(3):
+        limits.release("reports")
+    assert limits.in_flight("reports") == 0
+    assert limits.stats()["rejected"] == 1
+
+
+def test_usage_ledger_totals_per_user():
+    ledger = UsageLedger(pool=None)
+    ledger.record("alice", "gpt-4", prompt_tokens=10, completion_tokens=5, seconds=0.5)
+    ledger.record("alice", "gpt-4", cached=True, seconds=0.1)
+    ledger.record("bob", "gpt-4", ok=False)
+    alice = ledger.usage("alice")["alice"]
+    assert (alice["requests"], alice["cached_requests"], alice["prompt_tokens"], alice["completion_tokens"]) == (2, 1, 10, 5)
+    assert ledger.usage()["bob"]["failed_requests"] == 1
+    assert ledger.stats()["pending_rows"] == 2
+
+
+def test_wire_format_helpers():
+    event = chunk_event("chatcmpl-1", 123, "gpt-4", {"content": "hi"})
+    assert event.startswith("data: ") and event.endswith("\n\n")
+    assert json.loads(event[6:])["choices"][0]["delta"] == {"content": "hi"}
+    assert error_body("bad", "invalid_request_error", "unsupported_parameter", "n")["error"]["param"] == "n"
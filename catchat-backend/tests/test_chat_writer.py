@@ -0,0 +1,116 @@
+import contextlib
+import os
+
+import pytest
+from mysql.connector import errorcode
+from mysql.connector.errors import DatabaseError, DataError, InterfaceError
+
+from chat_writer import ChatHistoryWriter
+
+
+class FakePool:
+    """Records inserted rows; ``fail_with`` makes every insert raise, ``poison`` rejects rows by message"""
+
+    def __init__(self):
+        self.rows = []
+        self.fail_with = None
+        self.poison = set()
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield self
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, params):
+        if self.fail_with is not None:
+            raise self.fail_with
+        rows = [tuple(params[i:i + 4]) for i in range(0, len(params), 4)]
+        if any(row[1] in self.poison for row in rows):
+            raise DataError(msg="Data too long for column 'message'")
+        self.rows.extend(rows)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def record(message):
+    return {"user_id": 2, "message": message, "response": "ok", "timestamp": "2026-01-01 00:00:00"}
+
+
+@pytest.fixture
+def pool():
+    return FakePool()
+
+
+@pytest.fixture
+def writer(pool, tmp_path):
+    return ChatHistoryWriter(pool, str(tmp_path / "spill.jsonl"))
+
+
+def messages(pool):
+    return [row[1] for row in pool.rows]
+
+
+def test_rejected_rows_are_dropped_one_by_one(pool, writer):
+    pool.poison = {"bad"}
+    assert writer._flush([record("a"), record("bad"), record("c")])
+    assert messages(pool) == ["a", "c"]
+    assert writer.stats_counters["rejected"] == 1
+    assert not os.path.exists(writer.spill_path)
+
+
+@pytest.mark.parametrize("error", [
+    InterfaceError(msg="Lost connection"),
+    DatabaseError(msg="Lock wait timeout exceeded", errno=errorcode.ER_LOCK_WAIT_TIMEOUT),
+    DatabaseError(msg="Deadlock found", errno=errorcode.ER_LOCK_DEADLOCK),
+])
+def test_transient_errors_spill_and_replay(pool, writer, error):
+    pool.fail_with = error
+    assert not writer._flush([record("a"), record("b")])
+    assert os.path.exists(writer.spill_path)
+    assert writer.stats_counters["rejected"] == 0
+
+    pool.fail_with = None
+    writer._replay()
+    assert messages(pool) == ["a", "b"]
+    assert writer.stats_counters["replayed"] == 2
+    assert not os.path.exists(writer.spill_path)
+
+
+def test_only_one_worker_claims_the_spill_file(pool, writer, tmp_path, monkeypatch):
+    writer._spill([record("a"), record("b")])
+    claimed = writer._claim_spill()
+    assert claimed is not None and not os.path.exists(writer.spill_path)
+
+    # A second worker sharing the spill path finds nothing left to replay;
+    # the first worker's claim is kept because that process is alive
+    other = ChatHistoryWriter(pool, writer.spill_path)
+    monkeypatch.setattr(os, "getpid", lambda: 1)
+    assert other._claim_spill() is None
+    assert os.path.exists(claimed)
+
+
+def test_replay_files_of_dead_workers_are_taken_over(pool, writer):
+    dead = ChatHistoryWriter(pool, writer.spill_path)
+    dead._spill([record("orphaned")])
+    os.rename(writer.spill_path, writer.spill_path + ".replay.999999999")
+    writer._spill([record("fresh")])
+
+    writer._replay()
+    writer._replay()
+    assert sorted(messages(pool)) == ["fresh", "orphaned"]
+    assert not any(name.startswith("spill") for name in os.listdir(os.path.dirname(writer.spill_path)))
+
+
+def test_spills_after_a_claim_start_a_new_file(pool, writer):
+    writer._spill([record("a")])
+    claimed = writer._claim_spill()
+    writer._spill([record("b")])
+    with open(claimed) as old, open(writer.spill_path) as new:
+        assert len(old.readlines()) == 1 and len(new.readlines()) == 1
+    assert writer.stats()["spilled"] == 2
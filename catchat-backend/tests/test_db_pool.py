@@ -0,0 +1,87 @@
+import pytest
+from mysql.connector.errors import InterfaceError, OperationalError, PoolError, ProgrammingError
+
+import db_pool
+from db_pool import MySQLPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.pings = 0
+        self.closed = False
+        self.in_transaction = False
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+
+    def is_connected(self):
+        raise AssertionError("checkin must not ping the server")
+
+    def rollback(self):
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def connect(**config):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(db_pool.mysql.connector, "connect", connect)
+    return opened
+
+
+def test_connections_are_reused_without_a_ping_per_query(connections):
+    pool = MySQLPool({}, size=2, ping_interval=30)
+    for _ in range(3):
+        with pool.connection():
+            pass
+    assert len(connections) == 1
+    assert connections[0].pings == 0
+    assert pool.stats()["checkouts"] == 3
+
+
+def test_idle_connections_are_pinged_at_checkout(connections, monkeypatch):
+    pool = MySQLPool({}, size=1, ping_interval=30)
+    with pool.connection():
+        pass
+    clock = db_pool.time.monotonic() + 60
+    monkeypatch.setattr(db_pool.time, "monotonic", lambda: clock)
+    with pool.connection() as conn:
+        assert conn is connections[0]
+    assert connections[0].pings == 1
+
+
+def test_open_transactions_are_rolled_back_on_checkin(connections):
+    pool = MySQLPool({}, size=1)
+    with pool.connection() as conn:
+        conn.in_transaction = True
+    assert not connections[0].in_transaction
+
+
+@pytest.mark.parametrize("error, discarded", [
+    (OperationalError(msg="MySQL server has gone away", errno=2006), True),
+    (InterfaceError(msg="Lost connection"), True),
+    (ProgrammingError(msg="You have an error in your SQL syntax", errno=1064), False),
+])
+def test_only_connection_failures_discard_the_connection(connections, error, discarded):
+    pool = MySQLPool({}, size=1)
+    with pytest.raises(type(error)):
+        with pool.connection():
+            raise error
+    assert connections[0].closed is discarded
+    assert pool.stats()["discarded"] == int(discarded)
+
+
+def test_checkout_times_out_when_every_connection_is_in_use(connections):
+    pool = MySQLPool({}, size=1)
+    with pool.connection():
+        with pytest.raises(PoolError):
+            with pool.connection(timeout=0.01):
+                pass
+    assert pool.stats()["timeouts"] == 1
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from gazetteer import Gazetteer, extract_location
+
+PLACES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gazetteer_places.tsv")
+
+
+@pytest.fixture(scope="module")
+def gazetteer():
+    return Gazetteer.from_file(PLACES)
+
+
+def test_find_resolves_aliases_on_word_boundaries():
+    gazetteer = Gazetteer({"New York, NY": ["new york", "new york city", "nyc"], "Rio de Janeiro, Brazil": ["rio"]})
+    assert gazetteer.find("Is it raining in NYC?") == "New York, NY"
+    assert gazetteer.find("weather in new york city") == "New York, NY"
+    assert gazetteer.find("over the period") is None
+
+
+def test_find_all_prefers_leftmost_then_longest():
+    gazetteer = Gazetteer({"York, UK": ["york"], "New York, NY": ["new york"]})
+    assert gazetteer.find_all("new york or york") == [(0, 8, "New York, NY"), (12, 16, "York, UK")]
+
+
+def test_lookup_only_matches_whole_names():
+    gazetteer = Gazetteer({"Portland, OR": ["portland"]})
+    assert gazetteer.lookup("  Portland ") == "Portland, OR"
+    assert gazetteer.lookup("Portland, Maine") is None
+    assert gazetteer.lookup("port") is None
+
+
+@pytest.mark.parametrize("message, location", [
+    ("weather in Portland, Maine", "Portland, Maine"),
+    ("weather in London, Ontario?", "London, Ontario"),
+    ("weather in Paris, Texas", "Paris, Texas"),
+    ("what is the weather in paris?", "Paris, France"),
+    ("weather in nyc today", "New York, NY"),
+    ("weather in London on Monday", "London, UK"),
+    ("is it raining in nyc", "New York, NY"),
+    ("weather in Springfield", "Springfield"),
+    ("how's the weather", None),
+])
+def test_extract_location_keeps_what_the_user_typed(gazetteer, message, location):
+    assert extract_location(message, gazetteer) == location
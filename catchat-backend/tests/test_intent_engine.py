@@ -0,0 +1,87 @@
+import pytest
+
+from intent_engine import IntentEngine
+
+ROWS = [
+    {"id": 1, "quantum_application_id": 10, "confidence_threshold": 0.7,
+     "intent_pattern": r"grover", "parameter_extraction_pattern": None},
+    {"id": 2, "quantum_application_id": 20, "confidence_threshold": 0.9,
+     "intent_pattern": r"grover'?s? search (?:for|over) \w+",
+     "parameter_extraction_pattern": r"(?:for|over) (\w+)"},
+    {"id": 3, "quantum_application_id": 30, "confidence_threshold": 0.8,
+     "intent_pattern": r"(qubit)s? \1", "parameter_extraction_pattern": None},
+]
+
+
+class Table:
+    """Stands in for quantum_intent_mapping; ``rows`` None means the database is down"""
+
+    def __init__(self, rows, version=1):
+        self.rows = rows
+        self.version = version
+        self.loads = 0
+
+    def load_rows(self):
+        self.loads += 1
+        return self.rows
+
+    def load_version(self):
+        return self.version if self.rows is not None else None
+
+
+@pytest.fixture
+def table():
+    return Table(list(ROWS))
+
+
+@pytest.fixture
+def engine(table):
+    engine = IntentEngine(table.load_rows, table.load_version)
+    assert engine.reload()
+    return engine
+
+
+def test_highest_confidence_match_wins(engine):
+    assert engine.match("Run Grover's search for needles") == {
+        "application_id": 20, "confidence": 0.9, "parameters": "needles",
+    }
+    assert engine.match("tell me about grover") == {"application_id": 10, "confidence": 0.7, "parameters": None}
+
+
+def test_messages_matching_no_pattern(engine):
+    assert engine.match("what's the weather like") is None
+
+
+def test_patterns_with_backreferences_still_match(engine):
+    # A backreference disables the combined prefilter but not the pattern itself
+    assert engine.match("qubit qubit")["application_id"] == 30
+
+
+def test_invalid_patterns_are_skipped(table):
+    table.rows.append({"quantum_application_id": 40, "confidence_threshold": 1.0,
+                       "intent_pattern": "(unclosed", "parameter_extraction_pattern": None})
+    engine = IntentEngine(table.load_rows, table.load_version)
+    assert engine.reload()
+    assert engine.match("grover")["application_id"] == 10
+
+
+def test_match_never_loads_when_the_first_load_failed():
+    table = Table(None)
+    engine = IntentEngine(table.load_rows, table.load_version)
+    assert not engine.reload()
+    for _ in range(3):
+        assert engine.match("grover") is None
+    assert table.loads == 1
+
+    # The background poll retries until the table can be read
+    table.rows = list(ROWS)
+    assert engine.refresh_if_changed()
+    assert engine.match("grover")["application_id"] == 10
+
+
+def test_refresh_reloads_only_when_the_version_changes(engine, table):
+    assert not engine.refresh_if_changed()
+    table.rows = table.rows[:1]
+    table.version = 2
+    assert engine.refresh_if_changed()
+    assert engine.match("grover's search for needles")["application_id"] == 10
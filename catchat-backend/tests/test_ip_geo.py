@@ -0,0 +1,59 @@
+import pytest
+
+from ip_geo import IPRangeIndex, build_index, format_location
+
+DBIP_ROWS = """\
+1.0.0.0,1.0.0.255,OC,AU,Queensland,South Brisbane,-27.4767,153.017
+8.8.8.0,8.8.8.255,NA,US,California,Mountain View,37.4223,-122.085
+2001:200::,2001:200:ffff:ffff:ffff:ffff:ffff:ffff,AS,JP,Tokyo,Tokyo,35.6895,139.692
+81.2.69.0,81.2.69.127,EU,GB,England,London,51.5085,-0.12574
+"""
+
+
+@pytest.fixture
+def index_from(tmp_path):
+    opened = []
+
+    def build(text):
+        source = tmp_path / "ranges.csv"
+        source.write_text(text, encoding="utf-8")
+        out = str(tmp_path / "ranges.bin")
+        counts = build_index(str(source), out)
+        index = IPRangeIndex(out)
+        opened.append(index)
+        return counts, index
+
+    yield build
+    for index in opened:
+        index.close()
+
+
+def test_format_location_adds_the_region_for_us_cities_only():
+    assert format_location("Boston", "Massachusetts", "US") == "Boston, Massachusetts"
+    assert format_location("Paris", "Ile-de-France", "FR") == "Paris"
+    assert format_location("", "Texas", "US") is None
+
+
+def test_build_index_reads_the_dbip_city_lite_layout(index_from):
+    (range_count, location_count), index = index_from(DBIP_ROWS)
+    assert (range_count, location_count) == (3, 3)
+    assert index.lookup("8.8.8.8") == "Mountain View, California"
+    assert index.lookup("1.0.0.7") == "South Brisbane"
+    assert index.lookup("81.2.69.1") == "London"
+
+
+def test_lookup_misses_outside_every_range(index_from):
+    _, index = index_from(DBIP_ROWS)
+    assert index.lookup("0.255.255.255") is None
+    assert index.lookup("8.8.9.0") is None
+    assert index.lookup("81.2.69.200") is None
+    assert index.lookup("not an ip") is None
+
+
+def test_build_index_reads_columns_by_header(index_from):
+    (range_count, _), index = index_from(
+        "start_ip,end_ip,city,stateprov,country\n"
+        "8.8.8.0,8.8.8.255,Mountain View,California,US\n"
+    )
+    assert range_count == 1
+    assert index.lookup("8.8.8.8") == "Mountain View, California"
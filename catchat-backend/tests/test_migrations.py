@@ -0,0 +1,63 @@
+import re
+
+import pytest
+
+from migrate import discover_migrations
+
+# Checksums of migrations that have shipped. migrate.py reports an applied
+# migration whose file changed, so these files must never be edited again.
+SHIPPED = {
+    1: "f37127d668c35ec564671bd47488e289e0c8b753fb2f4e01356c363c2d569804",
+    2: "ae9abe93c10f15347e89a583b509a80986e7ed8595cc8bdd7089b9442e70aa27",
+}
+
+ALTER = re.compile(r"^ALTER TABLE (\w+) (.*)$", re.S)
+CHANGE = re.compile(r"(ADD|DROP) KEY `(\w+)`")
+
+
+class FakeSchema:
+    """Tracks index names per table from the ALTER TABLE statements a migration runs"""
+
+    def __init__(self, indexes):
+        self.indexes = {table: set(names) for table, names in indexes.items()}
+        self.statements = []
+
+    def query(self, statement, params=None):
+        if "information_schema.STATISTICS" in statement:
+            table, index = params
+            return [(1,)] if index in self.indexes.get(table, set()) else []
+        raise AssertionError(f"unexpected query: {statement}")
+
+    def execute(self, statement, params=None):
+        self.statements.append(statement)
+        table, changes = ALTER.match(statement.strip()).groups()
+        for action, index in CHANGE.findall(changes):
+            if action == "ADD":
+                self.indexes[table].add(index)
+            else:
+                self.indexes[table].remove(index)
+
+
+@pytest.fixture(scope="module")
+def migrations():
+    return {migration.version: migration for migration in discover_migrations()}
+
+
+def test_shipped_migrations_are_unchanged(migrations):
+    for version, checksum in SHIPPED.items():
+        assert migrations[version].checksum == checksum, f"migration {version:04d} was edited"
+
+
+def test_0003_drops_the_unused_index_but_keeps_one_for_the_foreign_key(migrations):
+    schema = FakeSchema({"quantum_intent_mapping": {"PRIMARY", "quantum_application_id"}})
+    migrations[1].load().upgrade_quantum_intent_mapping(schema)
+    assert "idx_application_confidence" in schema.indexes["quantum_intent_mapping"]
+
+    migrations[3].load().upgrade(schema)
+    assert schema.indexes["quantum_intent_mapping"] == {"PRIMARY", "quantum_application_id", "idx_intent_pattern"}
+
+
+def test_0003_is_a_no_op_without_the_index(migrations):
+    schema = FakeSchema({"quantum_intent_mapping": {"PRIMARY", "quantum_application_id"}})
+    migrations[3].load().upgrade(schema)
+    assert schema.statements == []
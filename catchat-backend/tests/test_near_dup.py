@@ -0,0 +1,68 @@
+import pytest
+
+from near_dup import NearDuplicateIndex, content_words, normalize_question
+
+
+@pytest.fixture
+def index():
+    return NearDuplicateIndex(threshold=0.8)
+
+
+def test_normalize_question_drops_punctuation_and_joins_apostrophes():
+    assert normalize_question("  How do I run Grover's   algorithm?! ") == "how do i run grovers algorithm"
+
+
+def test_content_words_keeps_negations():
+    assert content_words("is it safe") == "safe"
+    assert content_words("is it not safe") == "not safe"
+    assert content_words("what is it") == "what is it"
+
+
+@pytest.mark.parametrize("rewording", [
+    "which quantum computers do you have",
+    "What quantum computer do you have?",
+])
+def test_rewordings_of_the_same_question_match(index, rewording):
+    index.add("standard:7", "what quantum computers do you have", "We have three.")
+    match = index.lookup("standard:7", rewording)
+    assert match is not None
+    answer, similarity = match
+    assert answer == "We have three."
+    assert similarity >= index.threshold
+
+
+@pytest.mark.parametrize("question", [
+    "what quantum algorithms do you have",
+    "how do i run shor's algorithm",
+])
+def test_different_subjects_do_not_match(index, question):
+    index.add("standard:7", "what quantum computers do you have", "computers")
+    index.add("standard:7", "how do I run Grover's algorithm?", "grover")
+    assert index.lookup("standard:7", question) is None
+
+
+def test_lookups_stay_within_their_scope(index):
+    index.add("standard:7", "what quantum computers do you have", "for user 7")
+    assert index.lookup("standard:8", "what quantum computers do you have") is None
+
+
+def test_short_questions_are_neither_indexed_nor_looked_up(index):
+    index.add("standard:7", "tell me more", "more")
+    assert len(index) == 0
+    index.add("standard:7", "what quantum computers do you have", "computers")
+    assert index.lookup("standard:7", "and the others?") is None
+
+
+def test_long_questions_are_hashed_up_to_max_chars():
+    index = NearDuplicateIndex(max_chars=40)
+    body = "explain quantum entanglement teleportation protocol " * 20
+    assert index.signature(normalize_question(body)) == index.signature(normalize_question(body + "extra words"))
+
+
+def test_oldest_entries_are_evicted(index):
+    index = NearDuplicateIndex(max_entries=2)
+    for subject in ("superposition", "entanglement", "decoherence"):
+        index.add("s", f"explain quantum {subject} in simple terms", subject)
+    assert len(index) == 2
+    assert index.lookup("s", "explain quantum superposition in simple terms") is None
+    assert index.lookup("s", "explain quantum decoherence in simple terms")[0] == "decoherence"
@@ -0,0 +1,88 @@
+from decimal import Decimal
+
+import pytest
+
+from quantum_catalog import CatalogSnapshot, QuantumCatalog
+
+
+def system(name, qubits, is_free=True, description=""):
+    return {"name": name, "qubits": qubits, "type": "QVM", "is_free": is_free, "description": description,
+            "error_rate": Decimal("0.01")}
+
+
+FALLBACK = [system("fallback-qvm", 9)]
+
+
+class Table:
+    """Stands in for quantum_systems_catalog; ``rows`` None means the database is down"""
+
+    def __init__(self, rows, version=("2026-01-01", 1)):
+        self.rows = rows
+        self.version = version
+        self.loads = 0
+
+    def load_rows(self):
+        self.loads += 1
+        return self.rows
+
+    def load_version(self):
+        return self.version if self.rows is not None else None
+
+
+@pytest.fixture
+def table():
+    return Table([system("9q-square-qvm", 9, description="Local simulator"), system("Ankaa-2", 84, is_free=False)])
+
+
+def test_snapshot_derives_everything_once():
+    snapshot = CatalogSnapshot([system("a", 5), system("b", 80, is_free=False, description="big")], version=3)
+    assert snapshot.data["total_count"] == 2
+    assert (snapshot.data["free_systems_count"], snapshot.data["paid_systems_count"]) == (1, 1)
+    assert snapshot.data["systems"][0]["error_rate"] == "0.01"
+    assert snapshot.systems_text == "- a (5 qubits, QVM, Free)\n- b (80 qubits, QVM, Paid): big"
+    assert '"total_count": 2' in snapshot.json
+
+
+def test_snapshots_are_read_only():
+    snapshot = CatalogSnapshot([system("a", 5)])
+    with pytest.raises(AttributeError):
+        snapshot.version = 2
+    with pytest.raises(AttributeError):
+        del snapshot.data
+
+
+def test_unchanged_catalog_is_not_reread(table):
+    catalog = QuantumCatalog(table.load_rows, table.load_version, FALLBACK)
+    first = catalog.current()
+    assert not catalog.refresh_if_changed()
+    assert catalog.current() is first and table.loads == 1
+
+
+def test_a_change_swaps_in_a_new_snapshot(table):
+    catalog = QuantumCatalog(table.load_rows, table.load_version, FALLBACK)
+    first = catalog.current()
+    table.rows = table.rows[:1]
+    table.version = ("2026-01-02", 1)
+    assert catalog.refresh_if_changed()
+    assert catalog.current() is not first and catalog.current().data["total_count"] == 1
+    assert first.data["total_count"] == 2
+
+
+def test_fallback_until_the_table_can_be_read(table):
+    rows, table.rows = table.rows, None
+    catalog = QuantumCatalog(table.load_rows, table.load_version, FALLBACK)
+    assert catalog.current().source == "fallback"
+    assert not catalog.refresh_if_changed()
+
+    table.rows = rows
+    assert catalog.refresh_if_changed()
+    assert catalog.current().source == "database" and catalog.stats()["systems"] == 2
+
+
+def test_a_failed_reload_keeps_the_last_good_snapshot(table):
+    catalog = QuantumCatalog(table.load_rows, table.load_version, FALLBACK)
+    first = catalog.current()
+    table.rows = None
+    assert not catalog.reload()
+    assert catalog.current() is first
+    assert catalog.stats()["failed_reloads"] == 1
@@ -0,0 +1,33 @@
+import json
+
+from loadtest.replay import export_user_id, load_traffic
+
+
+def write_export(path, rows):
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+
+
+def test_export_records_are_sent_as_the_exported_user(tmp_path):
+    path = tmp_path / "chat_history_42.ndjson"
+    write_export(path, [
+        {"id": 2, "message": "second", "response": "b", "timestamp": "2026-01-01 10:00:05"},
+        {"id": 1, "message": "first", "response": "a", "timestamp": "2026-01-01 10:00:00"},
+    ])
+    traffic = load_traffic(str(path), user_id=export_user_id(str(path)))
+    assert [c.payload for c in traffic] == [
+        {"message": "first", "user_id": "42"},
+        {"message": "second", "user_id": "42"},
+    ]
+    assert [c.at for c in traffic] == [0.0, 5.0]
+
+
+def test_export_user_id_needs_the_export_name(tmp_path):
+    assert export_user_id(str(tmp_path / "chat_history_7.ndjson")) == "7"
+    assert export_user_id(str(tmp_path / "traffic.jsonl")) is None
+
+
+def test_recorded_user_id_is_kept(tmp_path):
+    path = tmp_path / "traffic.jsonl"
+    write_export(path, [{"message": "hi", "user_id": 3}, {"message": "hello"}])
+    traffic = load_traffic(str(path), user_id=9)
+    assert [c.payload["user_id"] for c in traffic] == ["3", "9"]
@@ -0,0 +1,73 @@
+import asyncio
+
+from singleflight import SingleFlight
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_concurrent_calls_for_a_key_share_one_run():
+    async def scenario():
+        flight = SingleFlight()
+        started = []
+
+        async def lookup(city):
+            started.append(city)
+            await asyncio.sleep(0.01)
+            return f"sunny in {city}"
+
+        results = await asyncio.gather(*(flight.do(city, lookup, city) for city in ["Boston"] * 5 + ["Paris"]))
+        return flight, started, results
+
+    flight, started, results = run(scenario())
+    assert sorted(started) == ["Boston", "Paris"]
+    assert results == ["sunny in Boston"] * 5 + ["sunny in Paris"]
+    assert flight.stats() == {"in_flight": 0, "calls": 2, "shared": 4}
+
+
+def test_waiters_share_the_exception():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        return await asyncio.gather(*(flight.do("k", failing) for _ in range(3)), return_exceptions=True)
+
+    results = run(scenario())
+    assert [str(result) for result in results] == ["upstream down"] * 3
+
+
+def test_a_cancelled_waiter_does_not_cancel_the_shared_call():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("k", slow))
+        second = asyncio.ensure_future(flight.do("k", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second, first
+
+    result, first = run(scenario())
+    assert result == "done"
+    assert first.cancelled()
+
+
+def test_nothing_is_remembered_after_the_call():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def lookup():
+            calls.append(1)
+            return len(calls)
+
+        return [await flight.do("k", lookup) for _ in range(2)]
+
+    assert run(scenario()) == [1, 2]
@@ -0,0 +1,58 @@
+import pytest
+
+import ttl_cache
+from ttl_cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ttl_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = TTLCache(ttl=10)
+    cache.set("user", 7)
+    cache.set("missing", None, ttl=2)
+    clock[0] += 5
+    assert cache.get("user") == 7
+    assert cache.get("missing", default="gone") == "gone"
+    clock[0] += 6
+    assert cache.get("user") is None
+    assert len(cache) == 0
+
+
+def test_ttl_none_never_expires(clock):
+    cache = TTLCache(ttl=None)
+    cache.set("user", 7)
+    clock[0] += 10 ** 9
+    assert cache.get("user") == 7
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "b" not in cache and cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_a_cached_none_is_a_hit(clock):
+    cache = TTLCache()
+    cache.set("user", None)
+    assert "user" in cache
+    assert cache.get("user", default="default") is None
+
+
+def test_pop_clear_and_stats(clock):
+    cache = TTLCache()
+    cache.set("a", 1)
+    assert cache.pop("a") == 1 and cache.pop("a", "none") == "none"
+    cache.set("b", 2)
+    cache.clear()
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (0, 1, 0)
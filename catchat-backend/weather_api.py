@@ -5,17 +5,13 @@ import os
 import logging
 from dotenv import load_dotenv
 from weather_service import WeatherService
+from log_pipeline import setup_logging_from_env
 
 # Load environment variables
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename='/root/catchat-backend/weather.log',
-    filemode='a'
-)
+setup_logging_from_env('/root/catchat-backend/weather.log')
 logger = logging.getLogger("weather_api")
 
 # Initialize FastAPI app
@@ -33,6 +29,10 @@ app.add_middleware(
 # Initialize the weather service
 weather_service = WeatherService()
 
+@app.on_event("shutdown")
+async def close_weather_service():
+    await weather_service.close()
+
 @app.get("/")
 async def home():
     return {"message": "Welcome to the Weather API"}
@@ -40,9 +40,9 @@ async def home():
 @app.get("/weather/current/{location}")
 async def get_current_weather(location: str):
     """Get current weather for a location"""
-    logger.info(f"Current weather request for {location}")
+    logger.info("Current weather request for %s", location)
     try:
-        result = weather_service.get_current_weather(location)
+        result = await weather_service.get_current_weather(location)
         if not result:
             logger.warning(f"No weather data found for {location}")
             raise HTTPException(status_code=404, detail=f"Weather data not found for {location}")
@@ -55,12 +55,12 @@ async def get_current_weather(location: str):
 @app.get("/weather/forecast/{location}")
 async def get_weather_forecast(location: str, days: int = 3):
     """Get weather forecast for a location"""
-    logger.info(f"Forecast request for {location}, {days} days")
+    logger.info("Forecast request for %s, %s days", location, days)
     try:
         if days < 1 or days > 15:
             raise HTTPException(status_code=400, detail="Days parameter must be between 1 and 15")
             
-        result = weather_service.get_forecast(location, days)
+        result = await weather_service.get_forecast(location, days)
         if not result:
             logger.warning(f"No forecast data found for {location}")
             raise HTTPException(status_code=404, detail=f"Forecast data not found for {location}")
@@ -73,7 +73,7 @@ async def get_weather_forecast(location: str, days: int = 3):
 @app.get("/weather/historical/{location}/{date}")
 async def get_historical_weather(location: str, date: str):
     """Get historical weather for a location on a specific date"""
-    logger.info(f"Historical weather request for {location} on {date}")
+    logger.info("Historical weather request for %s on %s", location, date)
     try:
         # Validate date format (YYYY-MM-DD)
         try:
@@ -81,7 +81,7 @@ async def get_historical_weather(location: str, date: str):
         except ValueError:
             raise HTTPException(status_code=400, detail="Date must be in YYYY-MM-DD format")
             
-        result = weather_service.get_historical_weather(location, date)
+        result = await weather_service.get_historical_weather(location, date)
         if not result:
             logger.warning(f"No historical data found for {location} on {date}")
             raise HTTPException(status_code=404, detail=f"Historical weather data not found for {location} on {date}")
@@ -94,7 +94,7 @@ async def get_historical_weather(location: str, date: str):
 @app.get("/weather/search")
 async def search_weather(query: str, type: str = "current"):
     """Search weather data based on query and type"""
-    logger.info(f"Weather search request: {query}, type: {type}")
+    logger.info("Weather search request: %s, type: %s", query, type)
     try:
         if type not in ["current", "forecast", "historical"]:
             raise HTTPException(status_code=400, detail="Type must be 'current', 'forecast', or 'historical'")
@@ -121,11 +121,11 @@ async def search_weather(query: str, type: str = "current"):
         
         # Call the appropriate weather service method
         if type == "current":
-            result = weather_service.get_current_weather(location)
+            result = await weather_service.get_current_weather(location)
         elif type == "forecast":
-            result = weather_service.get_forecast(location)
+            result = await weather_service.get_forecast(location)
         else:  # historical
-            result = weather_service.get_historical_weather(location, date)
+            result = await weather_service.get_historical_weather(location, date)
         
         if not result:
             logger.warning(f"No weather data found for query: {query}")
@@ -147,7 +147,8 @@ async def health_check():
         "status": "ok",
         "timestamp": datetime.now().isoformat(),
         "service": "weather-api",
-        "api_key_configured": bool(os.getenv("VISUAL_CROSSING_API_KEY"))
+        "api_key_configured": bool(os.getenv("VISUAL_CROSSING_API_KEY")),
+        "cache": weather_service.cache_stats()
     }
 
 if __name__ == "__main__":
@@ -1,71 +1,53 @@
-import requests
+import os
+import httpx
 import logging
 from typing import Optional, Dict, Any
 
+from metrics import timed
+
 logger = logging.getLogger("catchat")
 
 class WeatherClient:
-    def __init__(self, base_url="http://localhost:8001"):
+    def __init__(self, base_url="http://localhost:8001", timeout=None, max_connections=None):
         self.base_url = base_url
-    
-    def get_current_weather(self, location: str) -> Optional[Dict[str, Any]]:
-        """Get current weather for a location"""
+        timeout = timeout or float(os.getenv("WEATHER_CLIENT_TIMEOUT", "5"))
+        max_connections = max_connections or int(os.getenv("WEATHER_CLIENT_MAX_CONNECTIONS", "20"))
+        # One pooled keep-alive client for all calls to the weather API
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    async def _get(self, path, params=None, description="weather"):
         try:
-            url = f"{self.base_url}/weather/current/{location}"
-            response = requests.get(url, timeout=5)
-            
+            with timed("weather_client"):
+                response = await self.http.get(path, params=params)
+
             if response.status_code == 200:
                 return response.json()
             else:
-                logger.error(f"Error getting current weather: {response.status_code} - {response.text}")
+                logger.error(f"Error getting {description}: {response.status_code} - {response.text}")
                 return None
         except Exception as e:
             logger.error(f"Exception in weather client: {e}")
             return None
-    
-    def get_forecast(self, location: str, days: int = 3) -> Optional[Dict[str, Any]]:
+
+    async def get_current_weather(self, location: str) -> Optional[Dict[str, Any]]:
+        """Get current weather for a location"""
+        return await self._get(f"/weather/current/{location}", description="current weather")
+
+    async def get_forecast(self, location: str, days: int = 3) -> Optional[Dict[str, Any]]:
         """Get weather forecast for a location"""
-        try:
-            url = f"{self.base_url}/weather/forecast/{location}"
-            params = {"days": days}
-            response = requests.get(url, params=params, timeout=5)
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logger.error(f"Error getting forecast: {response.status_code} - {response.text}")
-                return None
-        except Exception as e:
-            logger.error(f"Exception in weather client: {e}")
-            return None
-    
-    def get_historical_weather(self, location: str, date: str) -> Optional[Dict[str, Any]]:
+        return await self._get(f"/weather/forecast/{location}", params={"days": days}, description="forecast")
+
+    async def get_historical_weather(self, location: str, date: str) -> Optional[Dict[str, Any]]:
         """Get historical weather for a location on a specific date"""
-        try:
-            url = f"{self.base_url}/weather/historical/{location}/{date}"
-            response = requests.get(url, timeout=5)
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logger.error(f"Error getting historical weather: {response.status_code} - {response.text}")
-                return None
-        except Exception as e:
-            logger.error(f"Exception in weather client: {e}")
-            return None
-    
-    def search_weather(self, query: str, type: str = "current") -> Optional[Dict[str, Any]]:
+        return await self._get(f"/weather/historical/{location}/{date}", description="historical weather")
+
+    async def search_weather(self, query: str, type: str = "current") -> Optional[Dict[str, Any]]:
         """Search weather data based on query and type"""
-        try:
-            url = f"{self.base_url}/weather/search"
-            params = {"query": query, "type": type}
-            response = requests.get(url, params=params, timeout=5)
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logger.error(f"Error searching weather: {response.status_code} - {response.text}")
-                return None
-        except Exception as e:
-            logger.error(f"Exception in weather client: {e}")
-            return None
+        return await self._get("/weather/search", params={"query": query, "type": type}, description="weather search")
+
+    async def close(self):
+        await self.http.aclose()
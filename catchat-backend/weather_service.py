@@ -1,16 +1,11 @@
 import os
-import requests
+import httpx
 import logging
 from datetime import datetime, timedelta
-from functools import lru_cache
-
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename='/root/catchat-backend/backend.log',
-    filemode='a'
-)
+from ttl_cache import TTLCache
+from singleflight import SingleFlight
+
+# Handlers are configured by the application (see log_pipeline.py)
 logger = logging.getLogger("weather_service")
 
 class WeatherService:
@@ -18,10 +13,56 @@ class WeatherService:
         self.api_key = os.getenv("VISUAL_CROSSING_API_KEY")
         if not self.api_key:
             logger.error("VISUAL_CROSSING_API_KEY not found in environment variables")
-        self.base_url = "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline"
-
-    def get_current_weather(self, location):
+        self.base_url = os.getenv(
+            "VISUAL_CROSSING_BASE_URL",
+            "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline"
+        )
+
+        # Each kind of data goes stale at its own pace: current conditions in
+        # minutes, forecasts in about an hour, past days never
+        cache_size = int(os.getenv("WEATHER_CACHE_SIZE", "512"))
+        self.current_cache = TTLCache(maxsize=cache_size, ttl=int(os.getenv("WEATHER_CURRENT_TTL", "600")))
+        self.forecast_cache = TTLCache(maxsize=cache_size, ttl=int(os.getenv("WEATHER_FORECAST_TTL", "3600")))
+        self.historical_cache = TTLCache(maxsize=cache_size, ttl=None)
+        self._inflight = SingleFlight()
+
+        # Pooled keep-alive client so repeated lookups reuse the TLS connection
+        max_connections = int(os.getenv("WEATHER_UPSTREAM_MAX_CONNECTIONS", "20"))
+        self.http = httpx.AsyncClient(
+            timeout=float(os.getenv("WEATHER_UPSTREAM_TIMEOUT", "10")),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    async def close(self):
+        await self.http.aclose()
+
+    @staticmethod
+    def _cache_key(location, *extra):
+        """Normalize a location so trivially different spellings share a cache entry"""
+        return (" ".join(str(location).lower().split()),) + extra
+
+    def cache_stats(self):
+        """Hit/miss counters for each weather cache"""
+        return {
+            "current": self.current_cache.stats(),
+            "forecast": self.forecast_cache.stats(),
+            "historical": self.historical_cache.stats(),
+            "coalesced": self._inflight.stats()
+        }
+
+    async def get_current_weather(self, location):
         """Get current weather conditions for a location"""
+        cache_key = self._cache_key(location)
+        cached = self.current_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Current weather cache hit for %s", location)
+            return cached
+
+        # Concurrent requests for the same data share one upstream call
+        return await self._inflight.do(("current",) + cache_key, self._fetch_current_weather, cache_key, location)
+
+    async def _fetch_current_weather(self, cache_key, location):
+        """Fetch current conditions from Visual Crossing and cache them"""
         try:
             url = f"{self.base_url}/{location}/today"
             params = {
@@ -31,12 +72,10 @@ class WeatherService:
                 "contentType": "json"
             }
 
-            logger.debug(f"Fetching current weather for {location} from URL: {url} with params: {params}")
-            response = requests.get(url, params=params, timeout=10)
-            logger.debug(f"Response status code: {response.status_code}")
+            logger.debug("Fetching current weather for %s", location)
+            response = await self.http.get(url, params=params)
             response.raise_for_status()
             data = response.json()
-            logger.debug(f"Response JSON: {data}")
 
             # If "currentConditions" is missing, fallback to the first element of "days"
             if not data.get('currentConditions'):
@@ -63,14 +102,26 @@ class WeatherService:
                 'timezone': data.get('timezone')
             }
 
-            logger.debug(f"Successfully retrieved current weather for {location}: {result}")
+            logger.debug("Retrieved current weather for %s (HTTP %s)", location, response.status_code)
+            self.current_cache.set(cache_key, result)
             return result
         except Exception as e:
             logger.error(f"Error fetching current weather: {e}", exc_info=True)
             return None
 
-    def get_forecast(self, location, days=3):
+    async def get_forecast(self, location, days=3):
         """Get weather forecast for a location"""
+        cache_key = self._cache_key(location, days)
+        cached = self.forecast_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Forecast cache hit for %s (%s days)", location, days)
+            return cached
+
+        # Concurrent requests for the same data share one upstream call
+        return await self._inflight.do(("forecast",) + cache_key, self._fetch_forecast, cache_key, location, days)
+
+    async def _fetch_forecast(self, cache_key, location, days):
+        """Fetch a forecast from Visual Crossing and cache it"""
         try:
             url = f"{self.base_url}/{location}/next{days}days"
             params = {
@@ -80,12 +131,10 @@ class WeatherService:
                 "contentType": "json"
             }
 
-            logger.debug(f"Fetching {days}-day forecast for {location} from URL: {url} with params: {params}")
-            response = requests.get(url, params=params, timeout=10)
-            logger.debug(f"Response status code: {response.status_code}")
+            logger.debug("Fetching %s-day forecast for %s", days, location)
+            response = await self.http.get(url, params=params)
             response.raise_for_status()
             data = response.json()
-            logger.debug(f"Response JSON: {data}")
 
             if not data.get('days'):
                 logger.warning(f"No forecast data found for {location}")
@@ -110,15 +159,26 @@ class WeatherService:
                 'timezone': data.get('timezone')
             }
 
-            logger.debug(f"Successfully retrieved forecast for {location}: {result}")
+            logger.debug("Retrieved %d forecast days for %s (HTTP %s)", len(forecasts), location, response.status_code)
+            self.forecast_cache.set(cache_key, result)
             return result
         except Exception as e:
             logger.error(f"Error fetching forecast: {e}", exc_info=True)
             return None
 
-    @lru_cache(maxsize=16)
-    def get_historical_weather(self, location, date):
+    async def get_historical_weather(self, location, date):
         """Get historical weather for a specific date"""
+        cache_key = self._cache_key(location, date)
+        cached = self.historical_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Historical weather cache hit for %s on %s", location, date)
+            return cached
+
+        # Concurrent requests for the same data share one upstream call
+        return await self._inflight.do(("historical",) + cache_key, self._fetch_historical_weather, cache_key, location, date)
+
+    async def _fetch_historical_weather(self, cache_key, location, date):
+        """Fetch a past day from Visual Crossing and cache it"""
         try:
             url = f"{self.base_url}/{location}/{date}"
             params = {
@@ -128,12 +188,10 @@ class WeatherService:
                 "contentType": "json"
             }
 
-            logger.debug(f"Fetching historical weather for {location} on {date} from URL: {url} with params: {params}")
-            response = requests.get(url, params=params, timeout=10)
-            logger.debug(f"Response status code: {response.status_code}")
+            logger.debug("Fetching historical weather for %s on %s", location, date)
+            response = await self.http.get(url, params=params)
             response.raise_for_status()
             data = response.json()
-            logger.debug(f"Response JSON: {data}")
 
             if not data.get('days'):
                 logger.warning(f"No historical data found for {location} on {date}")
@@ -153,7 +211,10 @@ class WeatherService:
                 'wind_speed': day.get('windspeed')
             }
 
-            logger.debug(f"Successfully retrieved historical data for {location} on {date}: {result}")
+            logger.debug("Retrieved historical weather for %s on %s (HTTP %s)", location, date, response.status_code)
+            # Days that are not over yet can still change, so only cache them like a forecast
+            is_past = date < datetime.utcnow().strftime("%Y-%m-%d")
+            self.historical_cache.set(cache_key, result, ttl=None if is_past else self.forecast_cache.ttl)
             return result
         except Exception as e:
             logger.error(f"Error fetching historical weather: {e}", exc_info=True)
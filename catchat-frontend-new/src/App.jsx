@@ -13,6 +13,8 @@ function App() {
   const [messages, setMessages] = useState([]);
   const [toast, setToast] = useState({ show: false, message: '' });
   const [isGuestMode, setIsGuestMode] = useState(false);
+  // One conversation per page load, so the backend can keep follow-up context
+  const [sessionId] = useState(() => crypto.randomUUID());
 
   // Auth0 hooks
   const { isAuthenticated, user, isLoading: auth0Loading, getAccessTokenSilently, logout } = useAuth0();
@@ -90,7 +92,8 @@ function App() {
           message: message,
           mode: 'standard',
           quantum_computer: "simulator",
-          qubits: 5
+          qubits: 5,
+          session_id: sessionId
         }),
       });
 
@@ -548,3 +548,6 @@ VALUES
 ('9q-square-qvm', 6, 0.2, 1.00, 0.00, 99.9, TRUE),
 ('9q-square-noisy-qvm', 6, 0.2, 1.00, 0.00, 99.9, TRUE),
 ('Ankaa-3', 6, 0.2, 1.00, 0.00, 95.0, FALSE);
+
+-- Indexes and monthly partitioning of chat_history are applied on top of this
+-- dump by the versioned migrations in catchat-backend/migrations (python migrate.py up).